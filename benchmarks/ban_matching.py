@@ -0,0 +1,70 @@
+"""Ban matching throughput.
+
+usage: python3 benchmarks/ban_matching.py [module_config.yaml] [rounds]
+
+Without a config, a Qt-scale synthetic ban list is used. Names are checked
+against `Config.is_banned` twice: cold (compilation and first verdicts)
+and warm (memoized verdicts).
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from hydra.conf import Config  # noqa: E402
+
+
+def synthetic_config(count: int = 300) -> Config:
+    config = Config("bench")
+    for idx in range(count):
+        config.ban(f"Ns{idx % 10}::Class{idx}::method{idx}(int, const QString &)")
+        config.ban(f"*::qt_method{idx}()")
+        config.ban(f"QtPrivate{idx}*")
+        config.ban(f"*Private{idx}")
+    return config
+
+
+def synthetic_names(count: int = 20000) -> list[str]:
+    names = []
+    for idx in range(count):
+        names.append(f"Ns{idx % 10}::Class{idx % 400}")
+        names.append(f"Ns{idx % 10}::Class{idx % 400}::method{idx % 300}(int, const QString &)")
+        names.append(f"Ns{idx % 10}::Class{idx % 400}::qt_method{idx % 500}()")
+        names.append(f"QtPrivate{idx % 600}::Helper")
+        names.append(f"Ns{idx % 10}::DataPrivate{idx % 350}")
+    return names
+
+
+def run(config: Config, names: list[str]) -> float:
+    start = time.perf_counter()
+    for name in names:
+        config.is_banned(name)
+    return time.perf_counter() - start
+
+
+def main():
+    if len(sys.argv) >= 2:
+        config = Config.parse(sys.argv[1])
+    else:
+        config = synthetic_config()
+    rounds = int(sys.argv[2]) if len(sys.argv) >= 3 else 5
+    names = synthetic_names()
+    banned = sum(config.is_banned(name) for name in names)
+    print(f"{len(config._ban_rules)} rules, {len(names)} names, {banned} banned")
+
+    cold = []
+    warm = []
+    for _ in range(rounds):
+        config._ban_rules.reset()
+        cold.append(run(config, names))
+        warm.append(run(config, names))
+    for label, timings in (("cold", cold), ("warm", warm)):
+        best = min(timings)
+        print(f"{label}: {best * 1e3:8.2f} ms, {len(names) / best:12.0f} names/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Generator pipeline timings on synthetic headers.
+
+usage: python3 benchmarks/pipeline.py [options] [-o results.json] [--compare previous.json]
+
+A header with the requested number of namespaces, classes, overloaded
+methods, inheritance depth, enums and templates is written to a temporary
+directory, then bound `--rounds` times. Each phase of `hydra.gen.generate`
+(parse, walk, closure, topo, generate, ...) is timed separately, the best
+round is kept. Code is emitted to memory, only the headers hit the disk.
+
+libclang does not ship the compiler builtin headers (stddef.h, ...), pass
+their directory with `-I` when the standard library needs them, e.g.
+`-I $(gcc -print-file-name=include)`.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import sysconfig
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from hydra import dom, gen  # noqa: E402
+from hydra.conf import Config  # noqa: E402
+from hydra.profile import Profiler  # noqa: E402
+from hydra.sink import MemorySink  # noqa: E402
+
+HEAVY_INCLUDES = [
+    "vector", "string", "map", "unordered_map", "memory", "functional",
+    "algorithm", "sstream", "iostream", "regex", "thread", "chrono",
+    "complex", "random", "tuple", "variant",
+]
+
+
+def synthetic_header(
+    classes: int = 200,
+    methods: int = 5,
+    depth: int = 3,
+    enums: int = 20,
+    templates: int = 10,
+    namespaces: int = 4,
+    heavy: int = 0,
+) -> str:
+    """C++ declarations, classes are spread over `namespaces` and derive in
+    chains of `depth`, each one with `methods` methods overloaded three times"""
+    out = ["#pragma once\n"]
+    for include in HEAVY_INCLUDES[:heavy]:
+        out.append(f"#include <{include}>\n")
+    for idx in range(templates):
+        out.append(
+            f"template <typename T> struct Box{idx} {{\n"
+            f"    T value;\n"
+            f"    T get() const {{ return value; }}\n"
+            f"    void set(const T &v) {{ value = v; }}\n"
+            f"}};\n"
+        )
+    for ns in range(namespaces):
+        out.append(f"namespace ns{ns} {{\n")
+        for idx in range(ns, enums, namespaces):
+            out.append(f"enum Enum{idx} {{ E{idx}_A, E{idx}_B, E{idx}_C }};\n")
+        for idx in range(ns, classes, namespaces):
+            base = idx - namespaces
+            if depth > 1 and base >= 0 and (idx // namespaces) % depth:
+                out.append(f"class Class{idx} : public Class{base} {{\n")
+            else:
+                out.append(f"class Class{idx} {{\n")
+            out.append("public:\n")
+            out.append(f"    Class{idx}() {{}}\n")
+            out.append(f"    enum Kind {{ K{idx}_X, K{idx}_Y }};\n")
+            for meth in range(methods):
+                out.append(f"    void method{meth}(int value);\n")
+                out.append(f"    void method{meth}(double value);\n")
+                out.append(f"    int method{meth}(const Class{idx} &other) const;\n")
+            if enums:
+                out.append(f"    Enum{idx % enums} get_mode() const;\n")
+                out.append(f"    void set_mode(Enum{idx % enums} mode);\n")
+            if templates:
+                out.append(f"    Box{idx % templates}<int> box;\n")
+            out.append("    int counter;\n")
+            out.append("};\n")
+        out.append(f"}} // namespace ns{ns}\n")
+    return "".join(out)
+
+
+def make_config(workdir: str, namespaces: int, include_path, cflags) -> Config:
+    config = Config("synthetic")
+    config.add_cflags(["-x", "c++", "-std=c++17", *cflags])
+    config.add_include_path(workdir)
+    try:
+        import pybind11
+    except ImportError:
+        pass
+    else:
+        config.add_include_path(pybind11.get_include())
+    config.add_include_path(sysconfig.get_paths()["include"])
+    for path in include_path:
+        config.add_include_path(path)
+    for ns in range(namespaces):
+        config.add_binding(f"ns{ns}", "synthetic.h")
+    return config
+
+
+def run(config: Config, outdir: str) -> tuple[dict[str, float], dict[str, int]]:
+    profiler = Profiler(trace_memory=False)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        gen.generate(config, outdir, profiler, open_sink=MemorySink)
+    timings = {phase["name"]: phase["wall"] for phase in profiler.phases}
+    timings["total"] = sum(timings.values())
+    return timings, profiler.counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--methods", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--enums", type=int, default=20)
+    parser.add_argument("--templates", type=int, default=10)
+    parser.add_argument("--namespaces", type=int, default=4)
+    parser.add_argument("--heavy", type=int, default=0, help=f"standard headers included, up to {len(HEAVY_INCLUDES)}")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("-I", dest="include_path", action="append", default=[])
+    parser.add_argument("--cflag", dest="cflags", action="append", default=[])
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="results of a previous run")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    gen.logger.setLevel(logging.ERROR)
+    dom.logger.setLevel(logging.ERROR)
+
+    params = {
+        name: getattr(args, name)
+        for name in ("classes", "methods", "depth", "enums", "templates", "namespaces", "heavy")
+    }
+    with tempfile.TemporaryDirectory(prefix="hydra-bench-") as workdir:
+        with open(os.path.join(workdir, "synthetic.h"), "w") as dst:
+            dst.write(synthetic_header(**params))
+        config = make_config(workdir, args.namespaces, args.include_path, args.cflags)
+        rounds = []
+        for _ in range(args.rounds):
+            timings, counters = run(config, workdir)
+            rounds.append(timings)
+
+    best = {name: min(timings[name] for timings in rounds) for name in rounds[0]}
+    results = {
+        "params": params,
+        "python": platform.python_version(),
+        "counters": counters,
+        "rounds": rounds,
+        "best": best,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as src:
+            previous = json.load(src)["best"]
+    print(f"{'phase':10s} {'best (s)':>10s}" + (f" {'previous':>10s} {'ratio':>7s}" if previous else ""))
+    for name, wall in best.items():
+        line = f"{name:10s} {wall:10.4f}"
+        if previous and name in previous:
+            line += f" {previous[name]:10.4f} {wall / previous[name] if previous[name] else 0:7.2f}"
+        print(line)
+    if args.output:
+        with open(args.output, "w") as dst:
+            json.dump(results, dst, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+// QString <-> str conversion timings, include/qtcasters.h against the
+// UTF-8 caster it replaced.
+//
+// build:
+//   g++ -O2 -std=c++17 -fPIC benchmarks/qstring_caster.cpp -I include \
+//       -I $(python3 -c "import pybind11; print(pybind11.get_include())") \
+//       $(python3-config --includes --ldflags --embed) \
+//       $(pkg-config --cflags --libs Qt5Core) -o qstring_caster
+// run:
+//   ./qstring_caster [iterations]
+//
+// Each sample string is converted `iterations` times both ways, the best
+// of 5 rounds is printed in ns per conversion.
+#include <qtcasters.h>
+#include <pybind11/embed.h>
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+
+namespace py = pybind11;
+
+namespace legacy {
+    PyObject *to_python(QString src) {
+        QByteArray utf8 = src.toUtf8();
+        return PyUnicode_FromStringAndSize(utf8.data(), utf8.size());
+    }
+
+    bool from_python(PyObject *source, QString &value) {
+        if (!PyUnicode_Check(source))
+            return false;
+        Py_ssize_t sz;
+        const char *s = PyUnicode_AsUTF8AndSize(source, &sz);
+        value = QString::fromUtf8(s, sz);
+        return true;
+    }
+}
+
+struct Sample {
+    const char *label;
+    QString value;
+};
+
+template <typename Fn>
+double best_ns(long iterations, Fn &&fn) {
+    double best = 1e300;
+    for (int round = 0; round < 5; ++round) {
+        auto start = std::chrono::steady_clock::now();
+        for (long idx = 0; idx < iterations; ++idx)
+            fn();
+        std::chrono::duration<double, std::nano> elapsed = std::chrono::steady_clock::now() - start;
+        best = std::min(best, elapsed.count() / iterations);
+    }
+    return best;
+}
+
+// the legacy loader caches a UTF-8 copy on the str, load fresh ones only
+template <typename Fn>
+double load_ns(const QString &value, long count, Fn &&load) {
+    double best = 1e300;
+    std::vector<PyObject *> strs(count);
+    for (int round = 0; round < 5; ++round) {
+        for (PyObject *&str : strs)
+            str = legacy::to_python(value);
+        auto start = std::chrono::steady_clock::now();
+        for (PyObject *str : strs)
+            load(str);
+        std::chrono::duration<double, std::nano> elapsed = std::chrono::steady_clock::now() - start;
+        best = std::min(best, elapsed.count() / count);
+        for (PyObject *str : strs)
+            Py_DECREF(str);
+    }
+    return best;
+}
+
+int main(int argc, char **argv) {
+    long iterations = argc > 1 ? std::atol(argv[1]) : 200000;
+    py::scoped_interpreter interpreter;
+
+    std::vector<Sample> samples = {
+        {"ascii 16", QString("sequencer_play()")},
+        {"ascii 1k", QString(1024, QChar('x'))},
+        {"latin-1 64", QString::fromUtf8("Caf\xc3\xa9 cr\xc3\xa8me br\xc3\xbbl\xc3\xa9" "e").repeated(4)},
+        {"bmp 64", QString::fromUtf8("\xe6\x97\xa5\xe6\x9c\xac\xe8\xaa\x9e").repeated(21)},
+        {"astral 64", QString::fromUtf8("\xf0\x9f\xa5\x81 drum ").repeated(8)},
+    };
+
+    std::printf("%-12s %12s %12s %8s %12s %12s %8s\n",
+                "sample", "to py old", "to py new", "ratio", "from py old", "from py new", "ratio");
+    for (const Sample &sample : samples) {
+        const QString &value = sample.value;
+        auto fresh = py::reinterpret_steal<py::object>(
+            py::detail::type_caster<QString>::cast(value, py::return_value_policy::copy, {}));
+        if (!fresh.equal(py::reinterpret_steal<py::object>(legacy::to_python(value)))) {
+            std::fprintf(stderr, "%s: conversions disagree\n", sample.label);
+            return 1;
+        }
+        double old_to = best_ns(iterations, [&] { Py_DECREF(legacy::to_python(value)); });
+        double new_to = best_ns(iterations, [&] {
+            Py_DECREF(py::detail::type_caster<QString>::cast(value, py::return_value_policy::copy, {}).ptr());
+        });
+
+        double old_from = load_ns(value, iterations / 10, [](PyObject *str) {
+            QString out;
+            legacy::from_python(str, out);
+        });
+        double new_from = load_ns(value, iterations / 10, [](PyObject *str) {
+            py::detail::type_caster<QString> caster;
+            caster.load(str, true);
+        });
+
+        std::printf("%-12s %12.1f %12.1f %8.2f %12.1f %12.1f %8.2f\n", sample.label,
+                    old_to, new_to, new_to / old_to, old_from, new_from, new_from / old_from);
+    }
+    return 0;
+}
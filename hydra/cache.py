@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from clang.cindex import Index, TranslationUnit, TranslationUnitLoadError, TranslationUnitSaveError
+from logzero import logger
+
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3  # 2GiB of saved translation units
+
+
+def digest(*chunks: str | bytes) -> str:
+    """sha256 of `chunks`, each chunk being delimited"""
+    sha = hashlib.sha256()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        sha.update(chunk)
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def file_digest(path: str | Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as src:
+        for block in iter(lambda: src.read(1 << 16), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def fingerprint(paths) -> dict[str, list]:
+    """(mtime, size, sha256) of every file in `paths`"""
+    prints = {}
+    for path in paths:
+        path = str(path)
+        if path in prints:
+            continue
+        st = os.stat(path)
+        prints[path] = [st.st_mtime_ns, st.st_size, file_digest(path)]
+    return prints
+
+
+def is_fresh(prints: dict[str, list]) -> bool:
+    """check a `fingerprint()` against the file system
+
+    mtime and size are checked first, contents are only hashed again
+    when the file has been touched.
+    """
+    for path, (mtime, size, sha) in prints.items():
+        try:
+            st = os.stat(path)
+        except OSError:
+            logger.debug("cache: %s is gone", path)
+            return False
+        if st.st_mtime_ns == mtime and st.st_size == size:
+            continue
+        if st.st_size != size or file_digest(path) != sha:
+            logger.debug("cache: %s changed", path)
+            return False
+    return True
+
+
+class AstCache:
+    """On disk cache of libclang translation units.
+
+    Entries are keyed by the parsed file contents and the parse arguments,
+    each entry holds the saved AST (`<key>.ast`) and a manifest
+    (`<key>.json`) fingerprinting every included file.
+    Least recently used entries are evicted once `max_size` is reached.
+    """
+
+    directory: Path
+    max_size: int
+
+    def __init__(self, directory: str | Path, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path: str | Path, args: list[str], options: int = 0) -> str:
+        with open(path, "rb") as src:
+            contents = src.read()
+        return digest(contents, str(options), *args)
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.directory / f"{key}.ast", self.directory / f"{key}.json"
+
+    def load(self, index: Index, key: str) -> TranslationUnit | None:
+        ast, manifest = self._paths(key)
+        if not ast.exists() or not manifest.exists():
+            return None
+        try:
+            with open(manifest) as src:
+                prints = json.load(src)["includes"]
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning("cache: bad manifest %s: %s", manifest, err)
+            return None
+        if not is_fresh(prints):
+            logger.info("cache: stale entry %s", key)
+            return None
+        try:
+            tu = index.read(str(ast))
+        except TranslationUnitLoadError as err:
+            logger.warning("cache: could not load %s: %s", ast, err)
+            return None
+        os.utime(ast)
+        logger.info("cache: hit %s", key)
+        return tu
+
+    def store(self, key: str, path: str | Path, tu: TranslationUnit):
+        """save `tu`, a full disk or a read-only directory only skips caching"""
+        ast, manifest = self._paths(key)
+        files = [path] + [inc.include.name for inc in tu.get_includes()]
+        # several processes may store the same entry
+        tmp = ast.with_suffix(f".ast.{os.getpid()}.tmp")
+        try:
+            tu.save(str(tmp))
+            os.replace(tmp, ast)
+            tmp = manifest.with_suffix(f".json.{os.getpid()}.tmp")
+            with open(tmp, "w") as dst:
+                json.dump({"source": str(path), "includes": fingerprint(files)}, dst)
+            os.replace(tmp, manifest)
+        except (TranslationUnitSaveError, OSError) as err:
+            logger.warning("cache: could not store %s: %s", key, err)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        logger.info("cache: stored %s", key)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for ast in self.directory.glob("*.ast"):
+            manifest = ast.with_suffix(".json")
+            try:
+                st = ast.stat()
+                size = st.st_size
+                if manifest.exists():
+                    size += manifest.stat().st_size
+            except OSError:  # evicted concurrently
+                continue
+            entries.append((st.st_mtime, size, ast, manifest))
+            total += size
+        entries.sort()
+        while total > self.max_size and entries:
+            _, size, ast, manifest = entries.pop(0)
+            logger.info("cache: evict %s", ast.stem)
+            ast.unlink(missing_ok=True)
+            manifest.unlink(missing_ok=True)
+            total -= size
@@ -1,6 +1,11 @@
 from __future__ import annotations, barry_as_FLUFL
 
+import fnmatch
+import functools
+import glob
+import os
 import pathlib
+import subprocess
 import sys
 from collections import abc
 from pathlib import Path
@@ -10,6 +15,146 @@ from logzero import logger
 from orderedset import OrderedSet
 
 
+def _dir_prefix(path: str) -> str:
+    """`path` resolved the way file names are in `Config.is_opaque_file()`,
+    with a trailing separator so that it only prefixes what it contains"""
+    return os.path.join(os.path.realpath(path), "")
+
+
+@functools.lru_cache(maxsize=None)
+def builtin_include_dirs() -> tuple[str, ...]:
+    """directories of the compiler builtin headers (stddef.h, ...): the ones
+    shipped with libclang and the one `$CXX -print-file-name=include` reports"""
+    dirs = []
+    try:
+        from clang.cindex import conf as clang_conf
+
+        library = clang_conf.get_filename()
+    except Exception:
+        library = None
+    if library and os.path.isabs(library):
+        library = os.path.realpath(library)
+        dirs.extend(glob.glob(os.path.join(os.path.dirname(library), "clang", "*", "include")))
+    try:
+        found = subprocess.run(
+            [os.environ.get("CXX", "c++"), "-print-file-name=include"],
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        found = ""
+    if os.path.isabs(found):
+        dirs.append(found)
+    return tuple(_dir_prefix(path) for path in dirs if os.path.isdir(path))
+
+
+def _trie(words) -> dict:
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[None] = True
+    return root
+
+
+def _trie_match(trie: dict, chars) -> bool:
+    """check if some word of `trie` is a prefix of `chars`"""
+    node = trie
+    if None in node:
+        return True
+    for char in chars:
+        node = node.get(char)
+        if node is None:
+            return False
+        if None in node:
+            return True
+    return False
+
+
+class NameMatcher:
+    """
+    Set of C++ name rules, compiled on first use:
+
+    - `name` or `name(signature)`: exact match
+    - `*::name` or `*::name(signature)`: match in any scope
+    - `*suffix`: fully qualified names ending with `suffix`
+    - `prefix*`: fully qualified or local names starting with `prefix`
+
+    Verdicts are memoized per name.
+    """
+
+    exact: set[str]
+    patterns: set[str]
+    prefixes: set[str]
+    suffixes: set[str]
+
+    def __init__(self):
+        self.exact = OrderedSet()
+        self.patterns = OrderedSet()
+        self.prefixes = OrderedSet()
+        self.suffixes = OrderedSet()
+        self._compiled = None
+        self._verdicts = {}
+
+    def __len__(self):
+        return len(self.exact) + len(self.patterns) + len(self.prefixes) + len(self.suffixes)
+
+    def add(self, cppname: str) -> NameMatcher:
+        if cppname.startswith("*::"):
+            self.patterns.add(cppname[3:])
+        elif cppname.startswith("*"):
+            self.suffixes.add(cppname[1:])
+        elif cppname.endswith("*") and not cppname.endswith('operator*'):
+            self.prefixes.add(cppname[:-1])
+        else:
+            self.exact.add(cppname)
+        return self.reset()
+
+    def reset(self) -> NameMatcher:
+        """forget the compiled rules and memoized verdicts, rebuilt on next match"""
+        self._compiled = None
+        self._verdicts = {}
+        return self
+
+    def compile(self) -> NameMatcher:
+        self._compiled = (
+            frozenset(self.exact),
+            frozenset(self.patterns),
+            _trie(self.prefixes) if self.prefixes else None,
+            _trie(sfx[::-1] for sfx in self.suffixes) if self.suffixes else None,
+        )
+        return self
+
+    def match(self, cppname: str) -> bool:
+        verdict = self._verdicts.get(cppname)
+        if verdict is None:
+            verdict = self._verdicts[cppname] = self._match(cppname)
+        return verdict
+
+    def _match(self, cppname: str) -> bool:
+        if self._compiled is None:
+            self.compile()
+        exact, patterns, prefixes, suffixes = self._compiled
+        if cppname in exact:
+            return True
+
+        fullname, paren, signature = cppname.partition("(")
+        if "::" in fullname:
+            localname = fullname.rsplit("::", 1)[1] + paren + signature
+            if localname in patterns:
+                return True
+        else:
+            localname = fullname
+
+        if suffixes and _trie_match(suffixes, reversed(fullname)):
+            return True
+        if prefixes and (
+            _trie_match(prefixes, fullname) or _trie_match(prefixes, localname)
+        ):
+            return True
+        return False
+
+
 class Config:
     """Config object holding all aspects binding generation"""
 
@@ -31,13 +176,33 @@ class Config:
     _bindings: dict[str, list[str | Path]]
     _exported_enum_values: set[str]
     _arith_enums: set[str]
+    _cache_dir: Path | None = None
+    _cache_max_size: int | None = None
+    _pch: bool = False
+    _pch_flags: list[str] = []
+    _shard: str | int | None = None
+    _shard_size: int = 32
+    _parse_jobs: int = 1
+    _lazy: bool = False
+    _opaque_templates: bool = False
+    _system_paths: list[str] | None = None
+    _path: str | None = None  # the yaml file, when parsed from one
+    _release_gil_heuristic: bool = False
+    _buffers: dict[str, tuple[str | None, str | None]]
+    _buffer_heuristic: bool = False
+    _sequence_heuristic: bool = False
+    _holder_rules: list[tuple[NameMatcher, str]]
+    _default_holder: str = "std::shared_ptr"
 
     def __init__(self, modname: str):
         self._module_name = modname
-        self._banned = OrderedSet()
-        self._banned_patterns = OrderedSet()
-        self._banned_prefixes = OrderedSet()
-        self._banned_suffixes = OrderedSet()
+        self._ban_rules = NameMatcher()
+        self._banned = self._ban_rules.exact
+        self._banned_patterns = self._ban_rules.patterns
+        self._banned_prefixes = self._ban_rules.prefixes
+        self._banned_suffixes = self._ban_rules.suffixes
+        self._release_gil_rules = NameMatcher()
+        self._overridable_rules = NameMatcher()
         self._cleaners = OrderedSet()
         self._plugins = OrderedSet()
         self._cflags = OrderedSet()
@@ -45,10 +210,14 @@ class Config:
         self._lambdas = dict()
         self._addon_methods = dict()
         self._policies = dict()
+        self._buffers = dict()
+        self._holder_rules = []
         self._prolog = OrderedSet()
         self._bindings = dict()
         self._exported_enum_values = OrderedSet()
         self._arith_enums = OrderedSet()
+        self._walk_include = OrderedSet()
+        self._walk_exclude = OrderedSet()
 
     @staticmethod
     def parse(path: str) -> Config:
@@ -57,14 +226,48 @@ class Config:
         module_data = data['module']
 
         conf = Config(module_data["name"])
+        conf._path = os.path.abspath(path)
         conf.add_cflags(module_data["flags"])
         for path in module_data["include_path"]:
             conf.add_include_path(path)
-        conf._bindings = module_data["bindings"]
+        for name, headers in module_data["bindings"].items():
+            conf.add_binding(name, headers)
 
         if 'ban' in module_data:
             conf.ban(module_data["ban"])
 
+        if 'release_gil' in module_data:
+            release_gil = module_data["release_gil"]
+            if isinstance(release_gil, dict):
+                conf.release_gil(release_gil.get("names", []), release_gil.get("heuristic"))
+            else:
+                conf.release_gil(release_gil)
+
+        if 'holders' in module_data:
+            holders = module_data["holders"]
+            if 'default' in holders:
+                conf.default_holder(holders["default"])
+            for rule in holders.get("rules", []):
+                conf.set_holder(rule.get("names") or rule["name"], rule["holder"])
+
+        if 'overridable' in module_data:
+            conf.overridable(module_data["overridable"])
+
+        if 'buffer_protocol' in module_data:
+            buffers = module_data["buffer_protocol"]
+            if isinstance(buffers, dict):
+                if 'heuristic' in buffers:
+                    conf.detect_buffers(buffers["heuristic"])
+                buffers = buffers.get("records", [])
+            for item in buffers:
+                if isinstance(item, str):
+                    conf.expose_buffer(item)
+                else:
+                    conf.expose_buffer(item["name"], item.get("data"), item.get("size"))
+
+        if 'sequence_protocol' in module_data:
+            conf.detect_sequences(module_data["sequence_protocol"])
+
         if 'cleaners' in module_data:
             for cleaner in module_data["cleaners"]:
                 conf.add_cleaner(cleaner)
@@ -102,7 +305,42 @@ class Config:
             conf.export_enum_values(module_data['export_enum_values'])
         if 'arith_enum' in module_data:
             conf.add_arith_enum(module_data['arith_enum'])
-
+        if 'cache' in module_data:
+            cache = module_data['cache']
+            if isinstance(cache, dict):
+                conf.set_cache(cache['dir'], cache.get('max_size'))
+            else:
+                conf.set_cache(cache)
+        if 'pch' in module_data:
+            pch = module_data['pch']
+            if isinstance(pch, dict):
+                conf.use_pch(pch.get('enabled', True), pch.get('flags'))
+            else:
+                conf.use_pch(pch)
+        if 'shard' in module_data:
+            shard = module_data['shard']
+            if isinstance(shard, dict):
+                conf.shard(shard['mode'], shard.get('size'))
+            else:
+                conf.shard(shard)
+        if 'parse_jobs' in module_data:
+            conf.parse_jobs(module_data['parse_jobs'])
+        if 'lazy' in module_data:
+            conf.walk_lazily(module_data['lazy'])
+        if 'prune' in module_data:
+            prune = module_data['prune']
+            conf.prune(
+                include=prune.get('include'),
+                exclude=prune.get('exclude'),
+                system_headers=prune.get('system_headers'),
+                template_internals=prune.get('template_internals'),
+            )
+
+        conf._ban_rules.compile()
+        conf._release_gil_rules.compile()
+        conf._overridable_rules.compile()
+        for rules, _ in conf._holder_rules:
+            rules.compile()
         return conf
 
     def ban(self, spec: str | list[str]) -> Config:
@@ -122,14 +360,131 @@ class Config:
         if isinstance(spec, str):
             spec = [spec]
         for cppname in spec:
-            if cppname.startswith("*::"):
-                self._banned_patterns.add(cppname[3:])
-            elif cppname.startswith("*"):
-                self._banned_suffixes.add(cppname[1:])
-            elif cppname.endswith("*") and not cppname.endswith('operator*'):
-                self._banned_prefixes.add(cppname[:-1])
-            else:
-                self._banned.add(cppname)
+            self._ban_rules.add(cppname)
+        return self
+
+    def release_gil(self, spec: str | list[str], heuristic: bool | None = None) -> Config:
+        """
+        release the GIL while calling the given functions and methods.
+
+        `spec` follows the `ban()` rules. With `heuristic`, callables whose
+        signature involves no python object are released too:
+
+        >>> config = (Config()
+        ...           .release_gil(["H2Core::Song::load",
+        ...                         "*::load_file",
+        ...                         "H2Core::Hydrogen::sequencer_*"])
+        ... )
+        """
+        if isinstance(spec, str):
+            spec = [spec]
+        for cppname in spec:
+            self._release_gil_rules.add(cppname)
+        if heuristic is not None:
+            self._release_gil_heuristic = bool(heuristic)
+        return self
+
+    def releases_gil(self, cppname: str) -> bool:
+        """check if the GIL is released while calling `cppname`"""
+        return self._release_gil_rules.match(cppname)
+
+    def set_holder(self, spec: str | list[str], holder: str) -> Config:
+        """
+        hold instances of the records matching `spec` (see `ban()`) in `holder`:
+
+        - a smart pointer template, `std::unique_ptr`, `std::shared_ptr` or a
+          custom one declared with `PYBIND11_DECLARE_HOLDER_TYPE` in a plugin
+        - a full type, where `{}` stands for the record
+        - `none`, for objects python never owns (`std::unique_ptr<T, py::nodelete>`)
+
+        >>> config = (Config()
+        ...           .set_holder(["H2Core::Hydrogen", "H2Core::Preferences"], "none")
+        ...           .set_holder("H2Core::*", "std::unique_ptr")
+        ... )
+
+        The first matching rule wins. pybind11 wants derived records to
+        share the holder of their bases, and `std::enable_shared_from_this`
+        needs a `std::shared_ptr`: rules contradicting these are ignored,
+        with a warning, see `Context.get_handler_policy()`.
+        """
+        if isinstance(spec, str):
+            spec = [spec]
+        rules = NameMatcher()
+        for cppname in spec:
+            rules.add(cppname)
+        self._holder_rules.append((rules, holder))
+        return self
+
+    def default_holder(self, holder: str) -> Config:
+        """holder of the records no `set_holder()` rule matches, `std::shared_ptr` by default"""
+        self._default_holder = holder
+        return self
+
+    def holder_for(self, cppname: str) -> str | None:
+        """the holder `set_holder()` gives to `cppname`, if any"""
+        for rules, holder in self._holder_rules:
+            if rules.match(cppname):
+                return holder
+        return None
+
+    def overridable(self, spec: str | list[str]) -> Config:
+        """
+        restrict python overrides to the given classes and virtual methods.
+
+        `spec` follows the `ban()` rules. Once set, only the listed methods,
+        or every virtual method of a listed class, go through a trampoline;
+        classes with virtual methods and nothing listed are final in python:
+
+        >>> config = (Config()
+        ...           .overridable(["H2Core::AudioOutput",
+        ...                         "H2Core::Object::toQString"])
+        ... )
+
+        Without it, every virtual method is overridable.
+        """
+        if isinstance(spec, str):
+            spec = [spec]
+        for cppname in spec:
+            self._overridable_rules.add(cppname)
+        return self
+
+    def is_overridable(self, cppname: str) -> bool:
+        """check if `cppname` is listed by `overridable()`"""
+        return self._overridable_rules.match(cppname)
+
+    def expose_buffer(self, fqr: str, data: str | None = None, size: str | None = None) -> Config:
+        """
+        give record `fqr` the buffer protocol, over the storage returned by
+        its `data` method, `size` elements long.
+
+        Without accessor names, a `data()`/`size()` style pair is looked
+        for, see `detect_buffers()`:
+
+        >>> config = (Config()
+        ...           .expose_buffer("H2Core::Sample", "get_data_l", "get_frames")
+        ...           .expose_buffer("QByteArray")
+        ... )
+        """
+        self._buffers[fqr] = (data, size)
+        return self
+
+    def detect_buffers(self, flag: bool = True) -> Config:
+        """give the buffer protocol to every record with a `data()`/`size()` style pair"""
+        self._buffer_heuristic = bool(flag)
+        return self
+
+    def detect_sequences(self, flag: bool = True) -> Config:
+        """
+        give container-like records `__len__`, `__getitem__`, `__iter__` and
+        `to_list()`, from their `size()`/`count()` and `get(int)`/`at(int)`/
+        `operator[]` methods, or their `begin()`/`end()` pair.
+        """
+        self._sequence_heuristic = bool(flag)
+        return self
+
+    def add_binding(self, name: str, headers: str | list[str]) -> Config:
+        """bind `name`, a record or a namespace and its records, from `headers`"""
+        self._bindings[name] = headers
         return self
 
     def add_include_path(self, path: str | Path) -> Config:
@@ -210,6 +565,122 @@ class Config:
     def arith_enum(self, name) -> bool:
         return name in self._arith_enums
 
+    def set_cache(self, path: str | Path, max_size: int | None = None) -> Config:
+        """cache parsed translation units in `path`, up to `max_size` bytes"""
+        self._cache_dir = Path(path).expanduser().absolute()
+        self._cache_max_size = max_size
+        return self
+
+    def use_pch(self, flag: bool = True, flags: str | list[str] | None = None) -> Config:
+        """
+        precompile the generated umbrella header for the C++ build, see
+        `Context.build_pch()`. `flags` are those of the C++ build not in the
+        cflags (-fPIC, -O2, ...), the pch is rejected by compiles that differ.
+        """
+        self._pch = bool(flag)
+        if isinstance(flags, str):
+            flags = flags.split()
+        if flags is not None:
+            self._pch_flags = list(flags)
+        return self
+
+    def shard(self, mode: str | int | None, size: int | None = None) -> Config:
+        """
+        split the generated module, see `hydra.gen.split_shards()`. `size`
+        bounds the bindings of a "namespace" shard, 32 by default.
+        """
+        if mode not in (None, "record", "namespace"):
+            if not str(mode).isdigit() or int(mode) <= 0:
+                raise ValueError("bad shard mode: %r" % mode)
+            mode = int(mode)
+        if size is not None:
+            if not str(size).isdigit() or int(size) <= 0:
+                raise ValueError("bad shard size: %r" % size)
+            self._shard_size = int(size)
+        self._shard = mode
+        return self
+
+    def parse_jobs(self, jobs: int) -> Config:
+        """parse binding headers in up to `jobs` translation units concurrently"""
+        jobs = int(jobs)
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        self._parse_jobs = jobs
+        return self
+
+    def walk_lazily(self, flag: bool = True) -> Config:
+        """only walk the parts of the AST actually used by the bindings"""
+        self._lazy = bool(flag)
+        return self
+
+    def prune(
+        self,
+        include: str | list[str] | None = None,
+        exclude: str | list[str] | None = None,
+        system_headers: bool | list[str] | None = None,
+        template_internals: bool | None = None,
+    ) -> Config:
+        """
+        declarations the walker does not descend into, they are kept as
+        opaque stubs so that type lookups still resolve:
+
+        - `include`: only files matching one of these globs are walked
+        - `exclude`: files matching one of these globs are not walked
+        - `system_headers`: true, or a list of system directories, whose
+          headers are not walked (true means /usr/include, -isystem ones
+          and those of the compiler builtin headers)
+
+        File names are resolved with `os.path.realpath()` first, as libclang
+        reports some of them relative to its own install directory.
+        - `template_internals`: do not walk function templates, alias
+          templates and partial specializations
+        """
+        if isinstance(include, str):
+            include = [include]
+        for glob in include or ():
+            self._walk_include.add(glob)
+        if isinstance(exclude, str):
+            exclude = [exclude]
+        for glob in exclude or ():
+            self._walk_exclude.add(glob)
+        if system_headers is True:
+            paths = ["/usr/include"]
+            flags = list(self._cflags)
+            for flag, value in zip(flags, flags[1:] + [""]):
+                if flag == "-isystem":
+                    paths.append(value)
+                elif flag.startswith("-isystem"):
+                    paths.append(flag[len("-isystem"):])
+            paths = [_dir_prefix(path) for path in paths]
+            paths.extend(builtin_include_dirs())
+            self._system_paths = list(OrderedSet(paths))
+        elif system_headers:
+            self._system_paths = [_dir_prefix(path) for path in system_headers]
+        elif system_headers is not None:
+            self._system_paths = None
+        if template_internals is not None:
+            self._opaque_templates = bool(template_internals)
+        return self
+
+    def is_opaque_file(self, path: str) -> bool:
+        """check if declarations from `path` should not be walked"""
+        path = os.path.realpath(path)
+        if self._walk_include and not any(
+            fnmatch.fnmatch(path, glob) for glob in self._walk_include
+        ):
+            return True
+        if any(fnmatch.fnmatch(path, glob) for glob in self._walk_exclude):
+            return True
+        if self._system_paths and any(
+            path.startswith(prefix) for prefix in self._system_paths
+        ):
+            return True
+        return False
+
+    @property
+    def prunes_files(self) -> bool:
+        return bool(self._walk_include or self._walk_exclude or self._system_paths)
+
     def emit(self, what) -> Config:
         for key in what:
             setattr(self, f"_emit_{key}", what[key])
@@ -223,41 +694,9 @@ class Config:
 
     def is_banned(self, cppname):
         """check if a given cppname is banned from bindings generation"""
-        banned = False
-        if cppname in self._banned:
-            return True
-
-        if '(' in cppname:
-            fullname, signature = cppname.split("(", 1)
-            signature = "(" + signature
-        else:
-            fullname, signature = cppname, ""
-
-        if '&&' in signature:  # pybind11 always barks on this
+        if '&&' in cppname.partition("(")[2]:  # pybind11 always barks on this
             return True
-
-        if "::" in fullname:
-            last = fullname.split("::")[-1]
-            localname = last + signature
-            if localname in self._banned_patterns:
-                banned = True
-        else:
-            localname = last = fullname
-
-        for sfx in self._banned_suffixes:
-            if fullname.endswith(sfx):
-                banned = True
-                break
-
-        for pfx in self._banned_prefixes:
-            if fullname.startswith(pfx):
-                banned = True
-                break
-            if localname.startwith(pfx):
-                banned = True
-                break
-
-        return banned
+        return self._ban_rules.match(cppname)
 
     def dump(self, file=None):
         if file is None:
@@ -282,6 +721,21 @@ class Config:
         print("plugins", file=file)
         for path in self.plugins:
             print("\t", path, file=file)
+        print("release gil", file=file)
+        for rule in self._release_gil_rules.exact:
+            print("\t", rule, file=file)
+        for rule in self._release_gil_rules.patterns:
+            print("\t", "*::" + rule, file=file)
+        if self._release_gil_heuristic:
+            print("\t", "(heuristic)", file=file)
+        print("holders", file=file)
+        for rules, holder in self._holder_rules:
+            for rule in (*rules.exact, *rules.patterns, *rules.prefixes, *rules.suffixes):
+                print("\t", rule, holder, file=file)
+        print("\t", "(default)", self._default_holder, file=file)
+        if self._cache_dir:
+            print("cache", file=file)
+            print("\t", self._cache_dir, file=file)
 
     @property
     def cleaners(self) -> list[str]:
@@ -298,3 +752,7 @@ class Config:
     @property
     def cflags(self) -> list[str]:
         return list(self._cflags)
+
+    @property
+    def pch_flags(self) -> list[str]:
+        return list(self._pch_flags)
@@ -1,8 +1,14 @@
 from __future__ import annotations
 from logging import StreamHandler
 
+import json
+import os
+import re
+import subprocess
 import sys
+import types
 from collections import abc
+from concurrent.futures import ThreadPoolExecutor
 import typing
 
 from clang.cindex import (
@@ -18,7 +24,12 @@ from clang.cindex import (
 from logzero import logger
 from orderedset import OrderedSet
 
+from .cache import AstCache, digest, fingerprint, is_fresh
 from .conf import Config
+from .profile import NULL_PROFILER, NullProfiler
+
+if typing.TYPE_CHECKING:
+    from .graph import DepGraph
 
 
 def kind(node):
@@ -32,40 +43,389 @@ class Context:
     factory: dict[CursorKind, abc.Callable[[Context, Cursor], NodeProxy | None]]
     config: Config
     elements: dict[str, NodeProxy]  # key is clang node's usr
+    names: dict[str, NodeProxy | tuple[NodeProxy, ...]]  # key is the fullname
+    signatures: dict[str, Callable]  # key is `fullname(signature)`
     builtins: dict[str, NodeProxy]
-    _casters: dict[NodeProxy, NodeProxy] | None
+    _casters: dict[NodeProxy, NodeProxy | str] | None
+    known_casters: dict[str, str] | None  # usr -> fullname, see discover_casters()
     _tx: TxUnit | None
+    cache: AstCache | None
+    profiler: NullProfiler
+    inputs: OrderedSet  # files read by the parses, see `gen.write_depfile()`
+    outputs: list[str]  # sources written by the last `gen.bind_module()`
 
-    def __init__(self, factory: dict[CursorKind, type], config: Config):
+    def __init__(self, factory: dict[CursorKind, type], config: Config, index: Index | None = None):
         self.factory = factory
         self.config = config
+        self.reset()
+        self._tu = None
+        self.preamble = False
+        self.lazy = config._lazy
+        self._opaque_files = {}
+        self.index = index or Index.create()
+        self.known_casters = None
+        self.inputs = OrderedSet()
+        self.outputs = []
+        self.cache = None
+        self.profiler = NULL_PROFILER
+        if config._cache_dir:
+            if config._cache_max_size:
+                self.cache = AstCache(config._cache_dir, config._cache_max_size)
+            else:
+                self.cache = AstCache(config._cache_dir)
+
+    def reset(self):
+        """forget every node, before walking a translation unit again"""
         self.elements = {}
+        self.names = {}
+        self.signatures = {}
+        self._unindexed = []
         self.builtins = {}
         self.stack = []
-        self.index = Index.create()
+        self._rules = {}
+        self._buffers = {}
+        self._sequences = {}
+        self._overrides = {}
+        self._holders = {}
+        self._tx = None
         self._casters = None
+        self._graph = None
 
-    def parse(self, path) -> tuple[TxUnit, list[Include]]:
-        tu = self.index.parse(
-            path,
-            self.config.cflags + ["-I%s" % path for path in self.config.include_path],
-            options=TranslationUnit.PARSE_INCOMPLETE
-            | TranslationUnit.PARSE_SKIP_FUNCTION_BODIES,
+    @property
+    def parse_args(self) -> list[str]:
+        return self.config.cflags + ["-I%s" % path for path in self.config.include_path]
+
+    def build_pch(self, header: str) -> str | None:
+        """precompile `header` for the C++ build, reusing the previous pch when
+        up to date, return the flags that make the compiler use it
+
+        The pch is built by `$CXX` (`c++` by default) from the parse arguments
+        and `Config.pch_flags`, a compile only uses it with the same flags.
+        g++ gets a `.gch` and clang a `.pch` next to `header`. None when the
+        compiler fails, the build then goes without.
+        """
+        header = os.path.abspath(header)
+        cxx = os.environ.get("CXX", "c++")
+        try:
+            version = subprocess.run(
+                [cxx, "--version"], capture_output=True, text=True, check=True
+            ).stdout
+        except (OSError, subprocess.CalledProcessError) as exc:
+            logger.warning("pch: no C++ compiler: %s", exc)
+            return None
+        if "clang" in version:
+            pch = header + ".pch"
+            flags = f"-include-pch {pch}\n"
+        else:
+            pch = header + ".gch"
+            flags = f"-include {header} -Winvalid-pch\n"
+        manifest = header + ".pch.json"
+        # g++ compiles and links a header with two -x, drop the cflags one
+        args = []
+        given = iter(self.parse_args + self.config.pch_flags)
+        for arg in given:
+            if arg == "-x":
+                next(given, None)
+            elif not arg.startswith("-x"):
+                args.append(arg)
+        args += ["-x", "c++-header"]
+        key = digest(version, *args)
+        try:
+            with open(manifest) as src:
+                data = json.load(src)
+            if data["args"] == key and os.path.exists(pch) and is_fresh(data["includes"]):
+                logger.info("pch: reuse %s", pch)
+                return flags
+        except (OSError, ValueError, KeyError):
+            pass
+        logger.info("pch: building %s", pch)
+        deps = pch + ".d"
+        build = subprocess.run(
+            [cxx, *args, header, "-o", pch + ".tmp", "-MD", "-MF", deps],
+            capture_output=True, text=True,
         )
-        for diag in tu.diagnostics:
-            print(diag, file=sys.stderr)
+        if build.returncode:
+            logger.warning("pch: %s failed:\n%s", cxx, build.stderr)
+            for path in (pch + ".tmp", deps):
+                if os.path.exists(path):
+                    os.unlink(path)
+            return None
+        os.replace(pch + ".tmp", pch)
+        with open(deps) as src:
+            # make rule: the target, then the prerequisites
+            files = re.split(r"(?<!\\)\s+", src.read().replace("\\\n", " ").strip())[1:]
+        os.unlink(deps)
+        files = [name.replace("\\ ", " ") for name in files if name]
+        with open(manifest, "w") as dst:
+            json.dump({"args": key, "includes": fingerprint(files)}, dst)
+        return flags
+
+    def _parse_tu(self, path, index: Index | None = None, cached: bool = True) -> TranslationUnit:
+        if index is None:
+            index = self.index
+        args = self.parse_args
+        options = self.parse_options
+        tu = None
+        cached = cached and self.cache and not self.preamble
+        if cached:
+            key = self.cache.key(path, args, options)
+            tu = self.cache.load(index, key)
+        if tu is None:
+            tu = index.parse(path, args, options=options)
+            for diag in tu.diagnostics:
+                print(diag, file=sys.stderr)
+            if cached:
+                self.cache.store(key, path, tu)
+        return tu
+
+    @property
+    def parse_options(self) -> int:
+        options = (
+            TranslationUnit.PARSE_INCOMPLETE
+            | TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+        )
+        if self.preamble:
+            # kept by libclang from the first reparse on
+            options |= TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+        return options
+
+    def parse(self, path) -> tuple[TxUnit, list[Include]]:
+        tu = self._tu = self._parse_tu(path)
         includes = [Include(inc) for inc in tu.get_includes()]
+        self.inputs.add(str(path))
+        self.inputs.update(inc.path for inc in includes)
         self._tx = typing.cast(TxUnit, self.make(tu.cursor))
         return self._tx, includes
 
+    def reparse(self) -> tuple[TxUnit, list[Include]]:
+        """parse the translation unit of `parse()` again, after its files changed
+
+        Nodes of the previous parse are dropped, walk the new TxUnit.
+        With `preamble` set, libclang reuses the precompiled preamble.
+        """
+        if self._tu is None:
+            raise ValueError("nothing parsed yet")
+        self._tu.reparse(options=self.parse_options)
+        for diag in self._tu.diagnostics:
+            print(diag, file=sys.stderr)
+        self.reset()
+        includes = [Include(inc) for inc in self._tu.get_includes()]
+        self.inputs.update(inc.path for inc in includes)
+        self._tx = typing.cast(TxUnit, self.make(self._tu.cursor))
+        return self._tx, includes
+
+    def parse_many(self, paths, jobs: int) -> tuple[TxUnit, list[Include]]:
+        """parse `paths` concurrently, then walk them into a single TxUnit
+
+        libclang releases the GIL while parsing, so the translation units are
+        parsed in a thread pool, each with its own Index. Walking stays
+        sequential, declarations met in several units are merged by USR in
+        `make()`.
+        """
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            tus = list(pool.map(lambda path: self._parse_tu(path, index=Index.create()), paths))
+        includes = []
+        seen = set()
+        for tu in tus:
+            for inc in tu.get_includes():
+                if inc.include.name not in seen:
+                    seen.add(inc.include.name)
+                    includes.append(Include(inc))
+        self.inputs.update(str(path) for path in paths)
+        self.inputs.update(inc.path for inc in includes)
+        tx = typing.cast(TxUnit, self.make(tus[0].cursor))
+        for tu in tus:
+            tx.walk(tu.cursor)
+        self._tx = tx
+        return self._tx, includes
+
+    @property
+    def graph(self) -> DepGraph:
+        if self._graph is None:
+            from .graph import DepGraph
+
+            self._graph = DepGraph(self)
+        return self._graph
+
+    def register(self, item: NodeProxy):
+        """queue a freshly attached `item` for the name indexes"""
+        if not item.usr:
+            return
+        self._unindexed.append(item)
+
+    def _index(self):
+        # fullnames are only computed once the walk has settled the parents
+        pending, self._unindexed = self._unindexed, []
+        for item in pending:
+            if not item.name:
+                continue
+            fullname = item.fullname
+            _add_named(self.names, fullname, item)
+            if isinstance(item, Callable):
+                self.signatures[f"{fullname}({item.cpp_signature})"] = item
+
+    def find(self, fullname: str) -> NodeProxy | tuple[NodeProxy, ...] | None:
+        """node(s) named `fullname`, None when there is none"""
+        if self._tx is None:
+            return None
+        try:
+            return self._tx[fullname]
+        except (KeyError, ValueError):
+            return None
+
+    def find_callable(self, key: str) -> Callable | None:
+        """function or method from `fullname(signature)`"""
+        fullname = key.partition("(")[0]
+        if self.lazy:
+            # materialize it and its siblings first
+            parent = fullname.rpartition("::")[0]
+            holder = self.find(parent) if parent else self._tx
+            if not isinstance(holder, NodeProxy):
+                return None
+            holder.materialize()
+        self._index()
+        return self.signatures.get(key)
+
+    def unmatched_config(self) -> list[str]:
+        """config entries naming nothing in the parsed headers
+
+        Ban, release_gil, overridable and holder patterns, prefixes and suffixes
+        are left out, only names and signatures are checked.
+        """
+        config = self.config
+        unmatched = []
+
+        def exists(name):
+            if "(" in name:
+                return self.find_callable(name) is not None
+            return self.find(name) is not None
+
+        for name in config._bindings:
+            if name != "*" and not exists(name):
+                unmatched.append(f"binding: {name}")
+        for name in config._ban_rules.exact:
+            if not exists(name):
+                unmatched.append(f"ban: {name}")
+        for name in config._policies:
+            if not exists(name):
+                unmatched.append(f"policy: {name}")
+        for name in config._release_gil_rules.exact:
+            if not exists(name):
+                unmatched.append(f"release_gil: {name}")
+        for fqr, signatures in config._lambdas.items():
+            if not exists(fqr):
+                unmatched.append(f"lambda: {fqr}")
+                continue
+            for signature in signatures:
+                if not exists(f"{fqr}::{signature}"):
+                    unmatched.append(f"lambda: {fqr}::{signature}")
+        for fqr in config._addon_methods:
+            if not exists(fqr):
+                unmatched.append(f"method: {fqr}")
+        for name in config._overridable_rules.exact:
+            if not exists(name):
+                unmatched.append(f"overridable: {name}")
+        for rules, _ in config._holder_rules:
+            for name in rules.exact:
+                if not exists(name):
+                    unmatched.append(f"holder: {name}")
+        for fqr in config._buffers:
+            if not exists(fqr):
+                unmatched.append(f"buffer: {fqr}")
+        for name in config._exported_enum_values:
+            if not exists(name):
+                unmatched.append(f"export_values: {name}")
+        for name in config._arith_enums:
+            if not exists(name):
+                unmatched.append(f"arithmetic: {name}")
+        return unmatched
+
+    def casters_manifest(self, header: str) -> str:
+        """where `discover_casters(header)` keeps its result
+
+        Next to `header`, or in the AST cache when there is one, shared by
+        every module with the same caster header and flags.
+        """
+        if self.cache is None:
+            return header + ".json"
+        with open(header, "rb") as src:
+            key = digest(src.read(), *self.parse_args)
+        return str(self.cache.directory / f"casters-{key}.json")
+
+    def discover_casters(self, header: str) -> dict[str, str]:
+        """types converted by the `type_caster` specializations `header` declares
+
+        `header` is parsed on its own, without walking it into nodes, and
+        the result is kept in `casters_manifest(header)` until one of the
+        files it includes (pybind11, plugins) changes. The main parse can
+        then leave pybind11 out. Returns, and sets `known_casters` to,
+        {usr: fullname}.
+        """
+        manifest = self.casters_manifest(header)
+        key = digest(*self.parse_args)
+        try:
+            with open(manifest) as src:
+                data = json.load(src)
+            if data["args"] == key and is_fresh(data["includes"]):
+                logger.info("casters: reuse %s", manifest)
+                self.inputs.update(data["includes"])
+                self.known_casters = data["casters"]
+                self._casters = None
+                return self.known_casters
+        except (OSError, ValueError, KeyError):
+            pass
+        logger.info("casters: scanning %s", header)
+        # the manifest is all later runs need, the AST is not worth caching
+        tu = self._parse_tu(header, cached=False)
+        casters = {}
+
+        def scan(cursor, scope):
+            for child in cursor.get_children():
+                if child.kind == CursorKind.NAMESPACE:
+                    if scope == ("pybind11",) and child.spelling == "detail":
+                        scan(child, scope + ("detail",))
+                    elif not scope and child.spelling == "pybind11":
+                        scan(child, ("pybind11",))
+                elif child.spelling == "type_caster" and scope == ("pybind11", "detail"):
+                    for ref in child.get_children():
+                        if ref.kind != CursorKind.TYPE_REF:
+                            continue
+                        decl = ref.referenced
+                        if decl is not None and decl.kind != CursorKind.TEMPLATE_TYPE_PARAMETER:
+                            casters[decl.get_usr()] = _qualified_name(decl)
+                        break
+
+        scan(tu.cursor, ())
+        files = [header] + [inc.include.name for inc in tu.get_includes()]
+        # modules sharing a cache directory may race for it
+        tmp = f"{manifest}.{os.getpid()}.tmp"
+        with open(tmp, "w") as dst:
+            json.dump({"args": key, "includes": fingerprint(files), "casters": casters}, dst)
+        os.replace(tmp, manifest)
+        self.inputs.update(files)
+        self.known_casters = casters
+        self._casters = None
+        return casters
+
     def casters(self):
+        """nodes converted by a pybind11 caster, rather than bound"""
         if self._casters is None:
             _casters = {}
             if not self._tx:
                 return {}
-            #casting = self._tx["pybind11::detail::type_caster"]
-            #breakpoint()
-            for casting in self._tx["pybind11::detail::type_caster"]:
+            if self.known_casters is not None:
+                for usr, fullname in self.known_casters.items():
+                    node = self.elements.get(usr)
+                    if node is None:
+                        node = self.find(fullname)
+                    if isinstance(node, NodeProxy):
+                        _casters[node] = fullname
+                self._casters = _casters
+                return self._casters
+            castings = self.find("pybind11::detail::type_caster")
+            if isinstance(castings, NodeProxy):
+                castings = (castings,)
+            for casting in castings or ():
                 tref = list(casting._filter(TypeRef))
                 if tref:
                     _casters[tref[0].type] = casting
@@ -84,61 +444,205 @@ class Context:
     def indent(self) -> str:
         return " " * len(self.stack)
 
-    def is_banned(self, item: NodeProxy) -> bool:
-        if self.config.is_banned(item.fullname):
-            return True
-        elif isinstance(item, Callable):
-            key = f"{item.fullname}({item.cpp_signature})"
-            return self.config.is_banned(key)
-        return False
+    def rules(self, item: NodeProxy) -> Rules:
+        """every config decision about `item`, computed once per USR"""
+        key = item.usr or item
+        rules = self._rules.get(key)
+        if rules is None:
+            rules = self._rules[key] = self._compute_rules(item)
+        return rules
+
+    def _compute_rules(self, item: NodeProxy) -> Rules:
+        rules = Rules()
+        config = self.config
+        fullname = item.fullname
+        if isinstance(item, Callable):
+            key = f"{fullname}({item.cpp_signature})"
+            rules.banned = config.is_banned(fullname) or config.is_banned(key)
+            rules.policy = config._policies.get(fullname) or config._policies.get(key)
+            if item.parent:
+                candidate = config._lambdas.get(item.parent.fullname)
+                if candidate:
+                    rules.lambda_code = candidate.get(item.displayname)
+            rules.release_gil = config.releases_gil(fullname) or config.releases_gil(key)
+            rules.overridable = config.is_overridable(fullname) or config.is_overridable(key)
+            if not rules.release_gil and config._release_gil_heuristic:
+                # lambdas are python aware code, leave them alone
+                rules.release_gil = rules.lambda_code is None and _python_free(item)
+        else:
+            rules.banned = config.is_banned(fullname)
+            rules.overridable = config.is_overridable(fullname)
+        if isinstance(item, Record):
+            candidate = config._addon_methods.get(fullname)
+            if candidate:
+                rules.addon_methods = list(candidate.items())
+        elif isinstance(item, Enum):
+            rules.export_values = config.are_enum_values_exported(fullname)
+            rules.arith = (
+                item.name == 'log_levels'
+                and item.parent is not None
+                and item.parent.name == 'Logger'
+            )
+        return rules
 
+    def is_banned(self, item: NodeProxy) -> bool:
+        return self.rules(item).banned
 
     def bind_with_lambda(self, item: Callable) -> str | None:
-        if not item.parent:
-            return None
-        candidate = self.config._lambdas.get(item.parent.fullname)
-        if candidate: 
-            return candidate.get(item.displayname)
-        return None
+        return self.rules(item).lambda_code
 
     def get_addon_methods(self, item: Record) -> list[tuple[str,str]]:
-        candidate = self.config._addon_methods.get(item.fullname)
-        if not candidate:
-            return []
-        else:
-            return list(candidate.items())
+        return self.rules(item).addon_methods
 
     def export_enum_values(self, item: Enum) -> bool:
-        return self.config.are_enum_values_exported(item.fullname)
+        return self.rules(item).export_values
 
     def lambda_code(self, item: NodeProxy) -> str:
         breakpoint()
         return ''
 
     def return_policy(self, item: Callable) -> str | None:
-        candidate = self.config._policies.get(item.fullname)
-        if not candidate:
-            key = item.fullname + '(' + item.cpp_signature + ')'
-            candidate = self.config._policies.get(key)
-        return candidate
+        return self.rules(item).policy
+
+    def buffer_accessors(self, item: Record) -> tuple[Method, Method] | None:
+        """the data/size methods backing the buffer protocol of `item`, if any"""
+        key = item.usr or item
+        try:
+            return self._buffers[key]
+        except KeyError:
+            pass
+        accessors = None
+        config = self.config
+        names = config._buffers.get(item.fullname)
+        if names:
+            accessors = _buffer_accessors(item, *names)
+            if accessors is None:
+                logger.warning("buffer protocol: no data/size accessors in %s", item.fullname)
+        elif config._buffer_heuristic:
+            accessors = _buffer_accessors(item)
+        self._buffers[key] = accessors
+        return accessors
+
+    def converts(self, type_: Type) -> bool:
+        """check if python can convert values of `type_`: builtins, bound or cast
+        records, and standard templates (see pybind11/stl.h) of those"""
+        while type_.kind in (TypeKind.POINTER, TypeKind.LVALUEREFERENCE, TypeKind.RVALUEREFERENCE):
+            type_ = type_.get_pointee()
+        type_ = type_.get_canonical()
+        if type_.kind not in _COMPOUND_KINDS:
+            return True
+        decl = type_.get_declaration()
+        if decl.kind == CursorKind.NO_DECL_FOUND:
+            return False
+        if _qualified_name(decl).startswith("std::"):
+            return all(
+                self.converts(type_.get_template_argument_type(idx))
+                for idx in range(max(type_.get_num_template_arguments(), 0))
+            )
+        node = self.lookup(decl.get_definition() or decl)
+        return node is not None and (node in self.graph.bound or node in self.casters())
 
-    def get_handler_policy(self, item: Record) ->str | None:
-        return "std::shared_ptr"
+    def iterates_convertible(self, begin: Method) -> bool:
+        """check if python can convert what the iterator returned by `begin` yields"""
+        element = _iterated_type(begin.node.result_type)
+        return element is not None and self.converts(element)
+
+    def sequence_accessors(self, item: Record) -> tuple[Method | None, Method | None, Method | None] | None:
+        """the methods backing the sequence protocol of `item`, see `_sequence_accessors()`"""
+        key = item.usr or item
+        try:
+            return self._sequences[key]
+        except KeyError:
+            pass
+        accessors = None
+        if self.config._sequence_heuristic:
+            accessors = _sequence_accessors(item, self.is_banned)
+        self._sequences[key] = accessors
+        return accessors
+
+    def release_gil(self, item: Callable) -> bool:
+        return self.rules(item).release_gil
+
+    def get_handler_policy(self, item: Record) -> str:
+        """the holder of `item`: the one of its bound bases, which pybind11
+        requires to match, else `std::shared_ptr` for
+        `std::enable_shared_from_this` descendants, else the configured one,
+        else the default one. Rules contradicting the first two are ignored."""
+        key = item.usr or item
+        try:
+            return self._holders[key]
+        except KeyError:
+            pass
+        configured = self.config.holder_for(item.fullname)
+        holder = None
+        for base in item.bases:
+            if base is not item and base in self.graph.bound:
+                holder = self.get_handler_policy(base)
+                reason = f"the one of its base {base.fullname}"
+                break
+        else:
+            if _shares_from_this(item.node):
+                holder = "std::shared_ptr"
+                reason = "it derives from std::enable_shared_from_this"
+        if holder is None:
+            holder = configured or self.config._default_holder
+        elif configured and configured != holder:
+            logger.warning(
+                "holder rule ignored: %s of %s, holder is %s as %s",
+                configured, item.fullname, holder, reason,
+            )
+        self._holders[key] = holder
+        return holder
+
+    def holder_type(self, item: Record) -> str:
+        """the holder argument of `py::class_` for `item`, see `Config.set_holder()`"""
+        holder = self.get_handler_policy(item)
+        if holder == "none":
+            return f"std::unique_ptr<{item.fullname}, py::nodelete>"
+        if "{}" in holder:
+            return holder.replace("{}", item.fullname)
+        return f"{holder}<{item.fullname}>"
 
     def arith_enum(self, enum: Enum) -> bool:
-        if enum.name == 'log_levels' and enum.parent.name == 'Logger':
-            return True
-        return False
+        return self.rules(enum).arith
+
+    def overrides(self, item: Record) -> list[Method]:
+        """virtual methods of `item` a python subclass may override, see `Config.overridable()`"""
+        key = item.usr or item
+        try:
+            return self._overrides[key]
+        except KeyError:
+            pass
+        methods = []
+        if not item.is_final():
+            virtuals = [
+                m for m in item.methods if m.is_public() and m.is_virtual() and not m.is_final()
+            ]
+            if not self.config._overridable_rules or self.rules(item).overridable:
+                methods = virtuals
+            elif any(self.rules(m).overridable for m in virtuals):
+                # the pure virtual ones too, the trampoline would be abstract otherwise
+                methods = [m for m in virtuals if m.is_pure_virtual() or self.rules(m).overridable]
+        self._overrides[key] = methods
+        return methods
 
     def needs_trampoline(self, item: Record | Enum | Function) -> bool:
         if isinstance(item, (Enum, Function)):
             return False
-        if item.is_abstract():
+        if item.is_final():
+            return False
+        if item.is_abstract() and not self.config._overridable_rules:
             return True
-        for m in item.methods:
-            if m.is_virtual():
-                return True
-        return False
+        return bool(self.overrides(item))
+
+    def is_final(self, item: Record) -> bool:
+        """check if python may not subclass `item`: C++ final, or polymorphic
+        with nothing `Config.overridable()`"""
+        if item.is_final():
+            return True
+        if not self.config._overridable_rules or self.needs_trampoline(item):
+            return False
+        return any(m.is_virtual() for m in item.methods)
 
     def get_default_value(self, param: Param) -> str | None:
         if param.name == 'bShort' and param.parent.name == 'toQString':
@@ -155,6 +659,7 @@ class Context:
     def make(self, node: Cursor) -> NodeProxy | None:
         usr = node.get_usr()
         obj = None
+        self.profiler.count("cursors visited")
         if self.factory.get(node.kind):
             # logger.debug("FACT %s %r, parent: %s", kind(node), usr, kind(node.semantic_parent))
             if usr:
@@ -163,14 +668,50 @@ class Context:
                     obj = self.factory[node.kind](self, node)
                     if obj:
                         self.elements[usr] = obj
+                        self.profiler.count("nodes created")
                     else:
                         logger.debug("skip: %s %s", node.kind, node.spelling)
                 else:
                     obj.accept_occurence(node)
             else:
                 obj = self.factory[node.kind](self, node)
+                if obj:
+                    self.profiler.count("nodes created")
+        return obj
+
+    def lookup(self, cursor: Cursor) -> NodeProxy | None:
+        """node for `cursor`, materializing its semantic parents when walking lazily"""
+        usr = cursor.get_usr()
+        obj = self.elements.get(usr)
+        if obj is None and self.lazy and usr:
+            parent = cursor.semantic_parent
+            if parent is None or parent.kind == CursorKind.TRANSLATION_UNIT:
+                holder = self._tx
+            else:
+                holder = self.lookup(parent)
+            if holder is not None:
+                holder.materialize()
+                obj = self.elements.get(usr)
         return obj
 
+    def is_opaque(self, cursor: Cursor) -> bool:
+        """check if the walker should keep `cursor` as a stub, see `Config.prune()`"""
+        kind = cursor.kind
+        if kind in (CursorKind.NAMESPACE, CursorKind.TRANSLATION_UNIT):
+            return False
+        if self.config._opaque_templates and kind in OPAQUE_TEMPLATES:
+            return True
+        if not self.config.prunes_files:
+            return False
+        file = cursor.location.file
+        if file is None:
+            return False
+        name = file.name
+        verdict = self._opaque_files.get(name)
+        if verdict is None:
+            verdict = self._opaque_files[name] = self.config.is_opaque_file(name)
+        return verdict
+
     def make_builtin(self, type_: Type) -> NodeProxy:
         node = self.builtins.get(type_.spelling)
         if not node:
@@ -179,7 +720,214 @@ class Context:
         return node
 
 
+_NO_CONTENT: abc.Mapping = types.MappingProxyType({})
+
+
+def _qualified_name(cursor: Cursor) -> str:
+    names = []
+    while cursor is not None and cursor.kind != CursorKind.TRANSLATION_UNIT:
+        names.append(cursor.spelling)
+        cursor = cursor.semantic_parent
+    return "::".join(reversed(names))
+
+
+_PYTHON_TYPES = re.compile(r"\bpybind11::|\bPyObject\b|\b_object\b")
+
+
+def _python_free(item: Callable) -> bool:
+    """check if no python object crosses the signature of `item`, nor is `this`
+
+    The canonical spelling sees through typedefs, `py::object`,
+    `PyObject *` (`_object *`), ...
+    """
+    return not (
+        _PYTHON_TYPES.search(item.fullname)
+        or _PYTHON_TYPES.search(item.node.type.get_canonical().spelling)
+    )
+
+
+_NUMERIC_KINDS = frozenset((
+    TypeKind.CHAR_U, TypeKind.UCHAR, TypeKind.CHAR_S, TypeKind.SCHAR,
+    TypeKind.SHORT, TypeKind.USHORT, TypeKind.INT, TypeKind.UINT,
+    TypeKind.LONG, TypeKind.ULONG, TypeKind.LONGLONG, TypeKind.ULONGLONG,
+    TypeKind.FLOAT, TypeKind.DOUBLE,
+))
+_INTEGRAL_KINDS = _NUMERIC_KINDS - {TypeKind.FLOAT, TypeKind.DOUBLE}
+_DATA_NAMES = ("data", "get_data", "getData")
+_SIZE_NAMES = (
+    "size", "get_size", "getSize", "count", "get_count", "getCount",
+    "length", "get_length", "getLength", "frames", "get_frames", "getFrames",
+)
+
+
+def _buffer_accessors(
+    rec: Record, data: str | None = None, size: str | None = None
+) -> tuple[Method, Method] | None:
+    """public, argument-less methods of `rec` returning a pointer to numbers
+    (named `data`, or one of `_DATA_NAMES`) and their count (`size`, or one
+    of `_SIZE_NAMES`), the non const pointer is preferred"""
+    data_names = (data,) if data else _DATA_NAMES
+    size_names = (size,) if size else _SIZE_NAMES
+    data_method = size_method = None
+    for method in rec.methods:
+        if method.is_static() or not method.is_public() or method.parameters:
+            continue
+        result = method.node.result_type.get_canonical()
+        if method.name in data_names and result.kind == TypeKind.POINTER:
+            pointee = result.get_pointee()
+            if pointee.kind not in _NUMERIC_KINDS:
+                continue
+            if data_method is None or (
+                data_names.index(method.name) < data_names.index(data_method.name)
+                or (method.name == data_method.name and not pointee.is_const_qualified())
+            ):
+                data_method = method
+        elif method.name in size_names and result.kind in _INTEGRAL_KINDS:
+            if size_method is None or size_names.index(method.name) < size_names.index(size_method.name):
+                size_method = method
+    if data_method is None or size_method is None:
+        return None
+    return data_method, size_method
+
+
+def _has_final_attr(cursor: Cursor) -> bool:
+    return any(child.kind == CursorKind.CXX_FINAL_ATTR for child in cursor.get_children())
+
+
+def _shares_from_this(cursor: Cursor) -> bool:
+    """check if the record at `cursor` derives from `std::enable_shared_from_this`"""
+    for child in cursor.get_children():
+        if child.kind != CursorKind.CXX_BASE_SPECIFIER:
+            continue
+        decl = child.type.get_declaration()
+        if decl.kind == CursorKind.NO_DECL_FOUND:
+            continue
+        if decl.spelling == "enable_shared_from_this" and _qualified_name(decl).startswith("std::"):
+            return True
+        if _shares_from_this(decl.get_definition() or decl):
+            return True
+    return False
+
+
+_LENGTH_NAMES = ("size", "count", "length")
+_ITEM_NAMES = ("get", "at", "operator[]")
+_COMPOUND_KINDS = frozenset((
+    TypeKind.RECORD, TypeKind.ELABORATED, TypeKind.ENUM, TypeKind.UNEXPOSED, TypeKind.INVALID,
+))
+
+
+def _sequence_accessors(
+    rec: Record, skip: abc.Callable[[Method], bool]
+) -> tuple[Method | None, Method | None, Method | None] | None:
+    """a length method of `rec` (one of `_LENGTH_NAMES`), an item method taking
+    an integer index (one of `_ITEM_NAMES`) and `begin()` when `end()` exists too;
+    None unless `rec` has a length and an item method, or begin and end"""
+    length = item = None
+    ends = {}
+    for method in rec.methods:
+        if method.is_static() or not method.is_public() or skip(method):
+            continue
+        result = method.node.result_type.get_canonical()
+        params = method.parameters
+        if not params:
+            if method.name in _LENGTH_NAMES and result.kind in _INTEGRAL_KINDS:
+                if length is None or _LENGTH_NAMES.index(method.name) < _LENGTH_NAMES.index(length.name):
+                    length = method
+            elif method.name in ("begin", "end"):
+                ends.setdefault(method.name, method)
+        elif (
+            len(params) == 1
+            and method.name in _ITEM_NAMES
+            and result.kind != TypeKind.VOID
+            and params[0].node.type.get_canonical().kind in _INTEGRAL_KINDS
+        ):
+            if item is None or _ITEM_NAMES.index(method.name) < _ITEM_NAMES.index(item.name):
+                item = method
+    begin = ends.get("begin") if len(ends) == 2 else None
+    if begin is None and (length is None or item is None):
+        return None
+    return length, item, begin
+
+
+def _iterated_type(iterator: Type) -> Type | None:
+    """what dereferencing `iterator` gives: pointers, iterators with a
+    resolved `operator*` and those wrapping a pointer (`__normal_iterator`)"""
+    iterator = iterator.get_canonical()
+    if iterator.kind == TypeKind.POINTER:
+        return iterator.get_pointee()
+    for child in iterator.get_declaration().get_children():
+        if child.kind == CursorKind.CXX_METHOD and child.spelling == "operator*":
+            result = child.result_type.get_canonical()
+            if result.kind in (TypeKind.LVALUEREFERENCE, TypeKind.RVALUEREFERENCE):
+                result = result.get_pointee()
+            if result.kind not in (TypeKind.UNEXPOSED, TypeKind.INVALID):
+                return result
+    if iterator.get_num_template_arguments() > 0:
+        first = iterator.get_template_argument_type(0).get_canonical()
+        if first.kind == TypeKind.POINTER:
+            return first.get_pointee()
+    return None
+
+
+def _add_named(table: dict, name: str, item: NodeProxy) -> bool:
+    """file `item` under `name`, a tuple when the name is shared"""
+    current = table.get(name)
+    if current is None:
+        table[name] = item
+    elif isinstance(current, tuple):
+        if item in current:
+            return False
+        table[name] = current + (item,)
+    elif current is item:
+        return False
+    else:
+        table[name] = (current, item)
+    return True
+
+
+class _Location:
+    """`item.location`, only computed when actually logged"""
+
+    __slots__ = ("item",)
+
+    def __init__(self, item: NodeProxy):
+        self.item = item
+
+    def __str__(self):
+        return str(self.item.location)
+
+
+class Rules:
+    """config decisions about a node, see `Context.rules()`"""
+
+    __slots__ = (
+        "banned", "policy", "release_gil", "overridable", "lambda_code", "addon_methods", "arith",
+        "export_values",
+    )
+
+    banned: bool
+    policy: str | None
+    release_gil: bool
+    overridable: bool
+    lambda_code: str | None
+    addon_methods: list[tuple[str, str]]
+    arith: bool
+    export_values: bool
+
+    def __init__(self):
+        self.banned = False
+        self.policy = None
+        self.release_gil = False
+        self.overridable = False
+        self.lambda_code = None
+        self.addon_methods = []
+        self.arith = False
+        self.export_values = False
+
+
 class Include:
+    __slots__ = ("_clang",)
+
     _clang: FileInclusion
 
     def __init__(self, fi: FileInclusion):
@@ -203,18 +951,33 @@ class Binder:
 
 
 class NodeProxy:
+    __slots__ = (
+        "name",
+        "node",
+        "context",
+        "parent",
+        "_content",
+        "_pending",
+        "opaque",
+        "_fullname",
+        "_usr",
+    )
+
     name: str
     node: Cursor
     context: Context
     parent: NodeProxy | None
-    content: dict
+    _content: dict | None
+    _pending: list[Cursor]  # cursors whose children are not walked yet
 
     def __init__(self, context: Context, node: Cursor, parent: NodeProxy | None = None):
         self.context = context
-        self.name = node.spelling # or node.get_usr()
+        self.name = sys.intern(node.spelling) # or node.get_usr()
         self.parent = parent
         self.node = node
-        self.content = {}
+        self._content = None
+        self._pending = []
+        self.opaque = False
         self._fullname = None
         self._usr = None
 
@@ -227,50 +990,51 @@ class NodeProxy:
         return f"<{self.__class__.__name__} {self.displayname!r}>"  # {self.usr!r}>"
 
     def accept(self, item):
+        semantic_parent = item.node.semantic_parent
         if (
-            item.node.semantic_parent
+            semantic_parent
             and item.kind
             not in (
                 CursorKind.TEMPLATE_TYPE_PARAMETER,
                 CursorKind.TEMPLATE_NON_TYPE_PARAMETER,
             )
-            # and item.node.semantic_parent.kind != CursorKind.TRANSLATION_UNIT
-            and item.node.semantic_parent.get_usr() != self.node.get_usr()
+            # and semantic_parent.kind != CursorKind.TRANSLATION_UNIT
+            and semantic_parent.get_usr() != (self.usr or "")
         ):
-            real_parent = self.context.elements.get(item.node.semantic_parent.get_usr())
+            real_parent = self.context.lookup(semantic_parent)
         else:
             real_parent = self
         if not real_parent:
             logger.warning("XXX rpnf: %s, %s %s:\n%s",
-            item, item.node.semantic_parent.kind, item.node.semantic_parent.spelling, item.location) 
+            item, semantic_parent.kind, semantic_parent.spelling, item.location) 
             return False
         if real_parent is self or isinstance(real_parent, ClassTemplate):
-            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, item.location)
-            real_parent.content.setdefault(item.name, OrderedSet()).add(item)
+            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, _Location(item))
+            real_parent.add_child(item)
             if not isinstance(real_parent, TxUnit):
                 item.parent = real_parent
         elif isinstance(item, TypeAliasTemplateDecl) and isinstance(real_parent, (Namespace, Record)):
-            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, item.location)
-            real_parent.content.setdefault(item.name, OrderedSet()).add(item)
+            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, _Location(item))
+            real_parent.add_child(item)
             if not isinstance(real_parent, TxUnit):
                 item.parent = real_parent
         elif isinstance(item, (Constructor, Destructor, Method)) and isinstance(real_parent, Record):
-            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, item.location)
-            real_parent.content.setdefault(item.name, OrderedSet()).add(item)
+            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, _Location(item))
+            real_parent.add_child(item)
             if not isinstance(real_parent, TxUnit):
                 item.parent = real_parent
         elif (isinstance(item, (Enum, Struct)) and isinstance(self, TypeDef)
             or isinstance(item, (Enum, Struct)) and isinstance(self, Field) and isinstance(real_parent, Record)):
             # small deviation
             logger.warning("TypeDef/Field Enum/Struct: %s, %s, %s: %s", item, self, real_parent, item.location)
-            logger.debug("ACCEPT(*): %s, item %s, loc: %s", self, item, item.location)
-            self.content.setdefault(item.name, OrderedSet()).add(item)
-            real_parent.content.setdefault(item.name, OrderedSet()).add(item)
+            logger.debug("ACCEPT(*): %s, item %s, loc: %s", self, item, _Location(item))
+            self.add_child(item)
+            real_parent.add_child(item)
             if not isinstance(real_parent, TxUnit):
                 item.parent = real_parent
         elif isinstance(self, (TxUnit, Namespace)) and isinstance(real_parent, (Namespace, Record)):
-            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, item.location)
-            real_parent.content.setdefault(item.name, OrderedSet()).add(item)
+            logger.debug("ACCEPT: %s, item %s, loc: %s", real_parent, item, _Location(item))
+            real_parent.add_child(item)
             if not isinstance(real_parent, TxUnit):
                 item.parent = real_parent
 
@@ -283,7 +1047,7 @@ class NodeProxy:
     def accept_occurence(self, node: Cursor):
         if isinstance(self, Callable):
             logger.warning("new occurence of %s: %s", self, node)
-        if not self.content:
+        if not self._content and not self._pending:
             self.node = node
 
     def is_bindable(self):
@@ -323,6 +1087,34 @@ class NodeProxy:
                     node.spelling,
                     node.location,
                 )
+        if self.context.lazy:
+            self._pending.append(node)
+            return self
+        return self._walk(node)
+
+    def materialize(self):
+        """walk children deferred by a lazy `walk()`"""
+        while self._pending:
+            self._walk(self._pending.pop(0))
+        return self
+
+    @property
+    def content(self) -> abc.Mapping[str, NodeProxy | tuple[NodeProxy, ...]]:
+        """children by name, a tuple when a name is shared"""
+        if self._pending:
+            self.materialize()
+        if self._content is None:
+            return _NO_CONTENT
+        return self._content
+
+    def add_child(self, item: NodeProxy):
+        if self._content is None:
+            # most nodes (params, refs, constants) never get a child
+            self._content = {}
+        if _add_named(self._content, item.name, item):
+            self.context.register(item)
+
+    def _walk(self, node):
         self.context.push(self)
         for child in node.get_children():
             obj = self.context.make(child)
@@ -330,7 +1122,12 @@ class NodeProxy:
                 ok = self.accept(obj)
                 if not ok:
                     logger.debug("reject! %s, self: %s", obj, self)
-                obj.walk(child)
+                if self.context.is_opaque(child):
+                    # stub, unless another occurrence has been walked
+                    obj.opaque = not obj._content and not obj._pending
+                else:
+                    obj.opaque = False
+                    obj.walk(child)
             else:
                 #logger.warning("abort!! %s %r", child.kind, child.spelling)
                 pass
@@ -371,7 +1168,7 @@ class NodeProxy:
     @property
     def fullname(self):
         if self._fullname is None:
-            self._fullname = (
+            self._fullname = sys.intern(
                 self.parent.fullname + "::" + self.name
                 if self.parent and self.parent.name
                 else self.name
@@ -381,11 +1178,21 @@ class NodeProxy:
     @property
     def usr(self):
         if self._usr is None:
-            self._usr = self.node.get_usr()
+            self._usr = sys.intern(self.node.get_usr())
         return self._usr or None
 
     def __getitem__(self, name_or_path) -> NodeProxy:
         if isinstance(name_or_path, str):
+            if not self.context.lazy:
+                # pending children may be missing from the index when lazy
+                if name_or_path.startswith("::") or isinstance(self, TxUnit):
+                    key = name_or_path.lstrip(":")
+                else:
+                    key = f"{self.fullname}::{name_or_path}"
+                self.context._index()
+                found = self.context.names.get(key)
+                if found is not None:
+                    return found
             name_or_path = name_or_path.split("::")
         head, tail = name_or_path[0], name_or_path[1:]
         ns = self
@@ -394,10 +1201,8 @@ class NodeProxy:
             head, tail = tail[0], tail[1:]
         sub = ns.content[head]
         if not tail:
-            if len(sub) == 1:
-                (sub,) = sub
             return sub
-        elif len(sub) == 1:
+        elif isinstance(sub, tuple):
             (sub,) = sub
         return sub[tail]
 
@@ -410,6 +1215,8 @@ class NodeProxy:
         if not predicate:
             predicate = lambda _: True
         for objs in self.content.values():
+            if not isinstance(objs, tuple):
+                objs = (objs,)
             for obj in objs:
                 if isinstance(obj, types) and predicate(obj):
                     yield obj
@@ -420,6 +1227,8 @@ class NodeProxy:
 
 
 class Bindable(NodeProxy):
+    __slots__ = ()
+
     def bind(self, binder: Binder):
         binder.bind(self)
 
@@ -428,10 +1237,12 @@ class Bindable(NodeProxy):
 
 
 class Builtin(NodeProxy):
+    __slots__ = ("type_",)
+
     def __init__(self, context: Context, type_: Type, parent: NodeProxy | None = None):
         super().__init__(context, type_.get_declaration(), parent)
         self.type_ = type_
-        self.name = type_.spelling
+        self.name = sys.intern(type_.spelling)
 
     @property
     def displayname(self):
@@ -442,6 +1253,8 @@ class Builtin(NodeProxy):
 
 
 class Namespace(NodeProxy):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.FUNCTION_DECL,
@@ -460,6 +1273,8 @@ class Namespace(NodeProxy):
 
 
 class TypeHolder(NodeProxy):
+    __slots__ = ("type_",)
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self.type_ = None
@@ -486,9 +1301,8 @@ class TypeHolder(NodeProxy):
             type_ref = type_ref[-1]
             decl = type_ref.node.get_definition()
             if decl:
-                try:
-                    node = self.context.elements[decl.get_usr()]
-                except KeyError:
+                node = self.context.lookup(decl)
+                if node is None:
                     logger.warn("lookup failed: decl: %s %s", decl.kind, decl.spelling)
         else:
             assert t
@@ -502,9 +1316,8 @@ class TypeHolder(NodeProxy):
             if decl:
                 defi = decl.get_definition()
                 if defi:
-                    try:
-                        node = self.context.elements[defi.get_usr()]
-                    except KeyError:
+                    node = self.context.lookup(defi)
+                    if node is None:
                         logger.debug(
                             "lookup failed(def): %s %s %s",
                             defi.kind,
@@ -512,9 +1325,8 @@ class TypeHolder(NodeProxy):
                             defi.get_usr(),
                         )
                 else:
-                    try:
-                        node = self.context.elements[decl.get_usr()]
-                    except KeyError:
+                    node = self.context.lookup(decl)
+                    if node is None:
                         logger.debug(
                             "lookup failed(decl): %s %s %s",
                             decl.kind,
@@ -550,6 +1362,8 @@ class TypeHolder(NodeProxy):
 
 
 class Callable(TypeHolder):
+    __slots__ = ("inline", "overloads", "_return_type", "_cpp_signature", "_parameters")
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self.inline = False
@@ -565,7 +1379,8 @@ class Callable(TypeHolder):
         return self.node.type
 
     def accept_occurence(self, node: Cursor):
-        self.content = {}
+        self._content = None
+        self._pending = []
         self.node = node
         self.inline = True
         self._return_type = None
@@ -601,10 +1416,12 @@ class Callable(TypeHolder):
 
 
 class Function(Callable, Bindable):
-    pass
+    __slots__ = ()
 
 
 class FunctionTemplate(Callable):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.TEMPLATE_TYPE_PARAMETER,
@@ -615,6 +1432,8 @@ class FunctionTemplate(Callable):
 
 
 class Method(Callable):
+    __slots__ = ()
+
     def is_static(self):
         return self.node.is_static_method()
 
@@ -624,17 +1443,25 @@ class Method(Callable):
     def is_pure_virtual(self):
         return self.node.is_pure_virtual_method()
 
+    def is_final(self):
+        return _has_final_attr(self.node)
+
     def is_const(self):
         return self.node.is_const_method()
 
 class TypeRef(TypeHolder):
-    pass
+    __slots__ = ()
 
 
 class TemplateRef(TypeHolder):
+    __slots__ = ()
+
     def _compute_type(self) -> NodeProxy:
         type_ref = self.node.get_definition()
-        return self.context.elements[type_ref.get_usr()]
+        node = self.context.lookup(type_ref)
+        if node is None:
+            raise KeyError(type_ref.get_usr())
+        return node
 
     def allowed(self, item):
         if item.kind in (
@@ -647,6 +1474,8 @@ class TemplateRef(TypeHolder):
 
 
 class TypeAliasDecl(TypeHolder):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (CursorKind.TYPE_REF, CursorKind.TEMPLATE_REF):
             return self.check_parent(item)
@@ -661,6 +1490,8 @@ class TypeAliasDecl(TypeHolder):
 
 
 class Param(TypeHolder):
+    __slots__ = ()
+
     def _get_clang_type(self) -> Type:
         type_ = self.node.type
         while type_.kind == TypeKind.POINTER:
@@ -674,7 +1505,7 @@ class Param(TypeHolder):
         if not st:
             logger.warning("hu... %s", self)
             type_ = self._get_clang_type()
-            st = self.context.elements.get(type_.get_declaration().get_usr())
+            st = self.context.lookup(type_.get_declaration())
         return st
 
     def allowed(self, item):
@@ -684,6 +1515,8 @@ class Param(TypeHolder):
 
 
 class Field(TypeHolder):
+    __slots__ = ()
+
 
     def _get_clang_type(self) -> Type:
         return self.node.get_definition().type
@@ -699,10 +1532,12 @@ class Field(TypeHolder):
 
 
 class Pop(NodeProxy):
-    pass
+    __slots__ = ()
 
 
 class TxUnit(NodeProxy):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.FUNCTION_DECL,
@@ -720,6 +1555,8 @@ class TxUnit(NodeProxy):
 
 
 class BaseSpecifier(TypeHolder):
+    __slots__ = ()
+
     def _get_clang_type(self):
         try:
             type_ref, *tail = self._filter((TypeRef, TemplateRef))
@@ -743,6 +1580,16 @@ class BaseSpecifier(TypeHolder):
 
 
 class Record(NodeProxy):
+    __slots__ = (
+        "_bases",
+        "_methods",
+        "_constructors",
+        "_destructors",
+        "_fields",
+        "_records",
+        "_enums",
+    )
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self._bases = None
@@ -777,6 +1624,9 @@ class Record(NodeProxy):
     def is_abstract(self):
         return self.node.is_abstract_record()
 
+    def is_final(self):
+        return _has_final_attr(self.node)
+
     @property
     def bases(self) -> list[Record]:
         if self._bases is None:
@@ -838,14 +1688,16 @@ class Record(NodeProxy):
 
 
 class Class(Bindable, Record):
-    pass
+    __slots__ = ()
 
 
 class Struct(Bindable, Record):
-    pass
+    __slots__ = ()
 
 
 class ClassTemplate(Record):
+    __slots__ = ("type_parameters", "instantiations")
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self.type_parameters = []
@@ -864,6 +1716,8 @@ class ClassTemplate(Record):
 
 
 class ClassTemplatePartialSpecialization(Record):
+    __slots__ = ("type_parameters", "instantiations")
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self.type_parameters = []
@@ -882,6 +1736,8 @@ class ClassTemplatePartialSpecialization(Record):
 
 
 class TypeDef(TypeHolder):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.TYPE_REF,
@@ -898,6 +1754,8 @@ class TypeDef(TypeHolder):
         return self.type and self.type.is_builtin()
 
 class Enum(Bindable, NodeProxy):
+    __slots__ = ("__members__",)
+
     def __init__(self, name, node, parent=None):
         super().__init__(name, node, parent)
         self.__members__ = []
@@ -916,10 +1774,12 @@ class Enum(Bindable, NodeProxy):
 
 
 class EnumConstant(NodeProxy):
-    pass
+    __slots__ = ()
 
 
 class Variable(NodeProxy):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.TYPE_REF,
@@ -932,6 +1792,8 @@ class Variable(NodeProxy):
 
 
 class TypeAliasTemplateDecl(NodeProxy):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.TYPE_REF,
@@ -946,6 +1808,8 @@ class TypeAliasTemplateDecl(NodeProxy):
 
 
 class TemplateTypeParam(NodeProxy):
+    __slots__ = ()
+
     def allowed(self, item):
         if item.kind in (
             CursorKind.TYPE_REF,
@@ -958,6 +1822,8 @@ class TemplateTypeParam(NodeProxy):
 
 
 class TemplateNonTypeParam(NodeProxy):
+    __slots__ = ("ref_type",)
+
     def __init__(self, context, node, parent=None):
         super().__init__(context, node, parent)
         self.ref_type = None
@@ -977,13 +1843,19 @@ class TemplateNonTypeParam(NodeProxy):
 
 
 class Constructor(Callable):
-    pass
+    __slots__ = ()
 
 
 class Destructor(Callable):
-    pass
+    __slots__ = ()
 
 
+OPAQUE_TEMPLATES = (
+    CursorKind.FUNCTION_TEMPLATE,
+    CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION,
+    CursorKind.TYPE_ALIAS_TEMPLATE_DECL,
+)
+
 FACTORY = {
     # CursorKind.ADDR_LABEL_EXPR,
     # CursorKind.ALIGNED_ATTR,
@@ -5,6 +5,9 @@ import os
 from logzero import logger
 from camel_snake_kebab import camelCase, snake_case
 from .conf import Config
+from .graph import stable_order
+from .profile import Profiler
+from .sink import FileSink, Sink, write_if_changed
 from .dom import (
     FACTORY,
     Context,
@@ -16,14 +19,18 @@ from .dom import (
     Record,
     Field,
     Enum,
+    Include,
     Namespace,
+    TxUnit,
 )
 from orderedset import OrderedSet
 import json
+import re
 
 import graphlib
 
 
+
 def c_decode(in_str: str) -> str:
     return json.loads(in_str.join('""' if '"' not in in_str else "''"))
 
@@ -133,48 +140,45 @@ class PyB11_{rec.name}: public {rec.fullname} {{
         // Inherit the constructors
         using {rec.fullname}::{rec.name};
 """)
-    for m in rec.methods:
-        if not m.is_public():
+    for m in context.overrides(rec):
+        override = 'PYBIND11_OVERRIDE'
+        if m.is_pure_virtual():
+            override = 'PYBIND11_OVERRIDE_PURE'
+        ## FIXME
+        #
+        # return_type = m.type.node.spelling # approximation
+        mtype = m.node.type.spelling.split('(')[0].strip()
+        return_type = mtype
+        if not return_type:
+            logger.warning("empty return type: %s", m)
             continue
-        if m.is_virtual():
-            override = 'PYBIND11_OVERRIDE'
-            if m.is_pure_virtual():
-                override = 'PYBIND11_OVERRIDE_PURE'
-            ## FIXME
-            #
-            # return_type = m.type.node.spelling # approximation
-            mtype = m.node.type.spelling.split('(')[0].strip()
-            return_type = mtype
-            if not return_type:
-                logger.warning("empty return type: %s", m)
-                continue
-            signature = m.cpp_signature
-            if '<' in signature:
-                logger.warning("can't parse signature: %s", m)
-                continue
-            param_types = signature.split(', ')
-            param_names = [p.name for p in m.parameters]
-            default_values = [context.get_default_value(p) for p in m.parameters]
-            params =  [ n if not dv else f'{n} = {dv}' for (n, dv) in zip(param_names, default_values)]
-            params = [' '.join([t, n]) for (t, n) in zip(param_types, params)]
-            signature = ', '.join(params)
-            constness = ""
-            if m.is_const():
-                constness = "const "
-                if m.name == "what" and m.parent.name == "runtime_error":
-                    constness += "noexcept "
-            emit(code,
-            f"""
+        signature = m.cpp_signature
+        if '<' in signature:
+            logger.warning("can't parse signature: %s", m)
+            continue
+        param_types = signature.split(', ')
+        param_names = [p.name for p in m.parameters]
+        default_values = [context.get_default_value(p) for p in m.parameters]
+        params =  [ n if not dv else f'{n} = {dv}' for (n, dv) in zip(param_names, default_values)]
+        params = [' '.join([t, n]) for (t, n) in zip(param_types, params)]
+        signature = ', '.join(params)
+        constness = ""
+        if m.is_const():
+            constness = "const "
+            if m.name == "what" and m.parent.name == "runtime_error":
+                constness += "noexcept "
+        emit(code,
+        f"""
         {return_type} {m.name}({signature}) {constness}override {{
             {override}(
                 {return_type},
                 {rec.fullname},
                 {m.name}""")
-            for p in m.parameters:
-                emit(code,
-                f""",\n\t\t\t{p.name}"""
-                    )
-            emit(code,"""
+        for p in m.parameters:
+            emit(code,
+            f""",\n\t\t\t{p.name}"""
+                )
+        emit(code,"""
                 );
             }
 """)
@@ -191,23 +195,40 @@ def generate_record(context: Context, rec: Record, bindings, code):
         return
     if not rec.name:
         return
+    context.profiler.count("records emitted")
     mro = OrderedSet()
     mro.add(rec.fullname)
     if context.needs_trampoline(rec):
         mro.add(f'PyB11_{rec.name}')
     for base in rec.bases:
-        if base in bindings: # and not base.is_abstract():
+        if base in context.graph.bound: # and not base.is_abstract():
             mro.add(base.fullname)
         else:
             logger.warning("base class not in bindings or abstract: %s %s", rec, base)
     mro = ', '.join(mro)
-    handler_policy = context.get_handler_policy(rec)
-    if handler_policy:
-        mro += f", {handler_policy}<{rec.fullname}>"
+    mro += f", {context.holder_type(rec)}"
+
+    buffer = context.buffer_accessors(rec)
+    options = ""
+    if buffer:
+        options += ", py::buffer_protocol()"
+    if context.is_final(rec):
+        options += ", py::is_final()"
+
+    emit(code, f"""\tpy::class_<{mro}> _{rec.name}(m, "{rec.name}"{options});""")
 
-    emit(code, f"""\tpy::class_<{mro}> _{rec.name}(m, "{rec.name}");""")
+    if buffer:
+        # a const pointer makes a readonly buffer
+        data, size = buffer
+        emit(
+            code,
+            f"""\n\t_{rec.name}.def_buffer([]({rec.fullname} &self) {{"""
+            f"""\n\t\treturn py::buffer_info(self.{data.name}(), static_cast<py::ssize_t>(self.{size.name}()));"""
+            f"""\n\t}});""",
+        )
 
-    if context.config._emit_ctors:
+    # without a trampoline, python cannot instantiate an abstract class
+    if context.config._emit_ctors and not (rec.is_abstract() and not context.needs_trampoline(rec)):
 
         for ctor in rec.constructors:
             if not ctor.is_public():
@@ -224,14 +245,8 @@ def generate_record(context: Context, rec: Record, bindings, code):
                 continue
             if context.is_banned(fld):
                 continue
-            for dep in fld.dependencies:
-                if (
-                    dep not in bindings
-                    and dep not in context.casters()
-                    and not dep.is_builtin()
-                ):
-                    skip = f"// [{dep}] "
-                    break
+            if dep := context.graph.unbound(fld):
+                skip = f"// [{dep}] "
 
             emit(
                 code,
@@ -319,6 +334,8 @@ def generate_record(context: Context, rec: Record, bindings, code):
             for m in signatures:
                 generate_method(context, rec, m, overloaded, bindings, code)
 
+        generate_sequence(context, rec, code)
+
     for name, mcode in context.get_addon_methods(rec):
         emit(
             code,
@@ -327,24 +344,93 @@ def generate_record(context: Context, rec: Record, bindings, code):
     emit(code, """\n\n""")
 
 
+def generate_sequence(context: Context, rec: Record, code):
+    """`__len__`, `__getitem__`, `__iter__` and `to_list()` for container-like records
+
+    `to_list()` and index based iteration convert every item in a single call.
+    """
+    accessors = context.sequence_accessors(rec)
+    if not accessors:
+        return
+    length, item, begin = accessors
+    if item and context.graph.unbound(item):
+        item = None
+    iterable = begin is not None and context.iterates_convertible(begin)
+    defined = {name for name, _ in context.get_addon_methods(rec)}
+    var = f"_{rec.name}"
+    this = f"{rec.fullname} &self"
+
+    def define(name, body, *extra):
+        if name in defined:
+            return
+        emit(code, f"""\n\t{var}.def("{name}", {body}""")
+        for arg in extra:
+            emit(code, f", {arg}")
+        emit(code, ");")
+
+    get = None
+    if length and item:
+        index = item.parameters[0].node.type.get_canonical().spelling
+        if item.name == "operator[]":
+            get = f"self[static_cast<{index}>(i)]"
+        else:
+            get = f"self.{item.name}(static_cast<{index}>(i))"
+    if length:
+        define("__len__", f"[]({this}) {{ return self.{length.name}(); }}")
+    if get:
+        define(
+            "__getitem__",
+            f"[]({this}, py::ssize_t i) {{"
+            f"\n\t\tpy::ssize_t n = static_cast<py::ssize_t>(self.{length.name}());"
+            f"\n\t\tif (i < 0) i += n;"
+            f"\n\t\tif (i < 0 || i >= n) throw py::index_error();"
+            f"\n\t\treturn {get};"
+            f"\n\t}}",
+            "py::return_value_policy::reference_internal",
+        )
+        define(
+            "to_list",
+            f"[](py::object owner) {{"
+            f"\n\t\tauto &self = owner.cast<{rec.fullname} &>();"
+            f"\n\t\tpy::ssize_t n = static_cast<py::ssize_t>(self.{length.name}());"
+            f"\n\t\tpy::list items(n);"
+            f"\n\t\tfor (py::ssize_t i = 0; i < n; ++i)"
+            f"\n\t\t\titems[i] = py::cast({get}, py::return_value_policy::reference_internal, owner);"
+            f"\n\t\treturn items;"
+            f"\n\t}}",
+        )
+    elif iterable:
+        define(
+            "to_list",
+            f"[](py::object owner) {{"
+            f"\n\t\tauto &self = owner.cast<{rec.fullname} &>();"
+            f"\n\t\tpy::list items;"
+            f"\n\t\tfor (auto it = self.begin(); it != self.end(); ++it)"
+            f"\n\t\t\titems.append(py::cast(*it, py::return_value_policy::reference_internal, owner));"
+            f"\n\t\treturn items;"
+            f"\n\t}}",
+        )
+    if iterable:
+        define(
+            "__iter__",
+            f"[]({this}) {{ return py::make_iterator(self.begin(), self.end()); }}",
+            "py::keep_alive<0, 1>()",
+        )
+    elif get:
+        define("__iter__", """[](py::object owner) { return py::iter(owner.attr("to_list")()); }""")
+
+
 def generate_method(
     context: Context, rec: Record, m: Method, overloaded: bool, bindings, code
 ):
     if not context.config._emit_methods:
         return
     skip = ""
-    for dep in m.dependencies:
-        if dep.name == "qreal":
-            breakpoint()
-        if (
-            dep not in bindings
-            and dep not in context.casters()
-            and not dep.is_builtin()
-        ):
-            skip = f"// [{dep}] "
-            break
+    if dep := context.graph.unbound(m):
+        skip = f"// [{dep}] "
     if not m.is_public():
         return
+    context.profiler.count("methods emitted")
     rb = context.return_policy(m)
 
     if context.is_banned(m):
@@ -378,6 +464,8 @@ def generate_method(
         emit(code, f""",\n\t{skip}\tpy::arg("{param.name}")""".strip())
     if rb:
         emit(code, f",\n\t{rb}")
+    if context.release_gil(m):
+        emit(code, f",\n\t{skip}\tpy::call_guard<py::gil_scoped_release>()")
     emit(code, ");")
 
 
@@ -389,14 +477,8 @@ def generate_function(
     context: Context, fun: Function, overloaded: bool, bindings: list, code
 ):
     skip = ""
-    for dep in fun.dependencies:
-        if (
-            (dep not in bindings)
-            and (dep not in context.casters())
-            and not dep.is_builtin()
-        ):
-            skip = f"// [{dep}] "
-            break
+    if dep := context.graph.unbound(fun):
+        skip = f"// [{dep}] "
     if not fun.is_public():
         return
 
@@ -429,9 +511,25 @@ def generate_function(
         )
     for param in fun.parameters:
         emit(code, f""",\n\t{skip}\tpy::arg("{param.name}")""".strip())
+    if context.release_gil(fun):
+        emit(code, f",\n\t{skip}\tpy::call_guard<py::gil_scoped_release>()")
     emit(code, ");")
 
 
+def generate_bindings(context: Context, shard, bindings, code):
+    """emit `shard` members, `bindings` being the whole module"""
+    for binding in shard:
+        with context.profiler.span(binding.fullname, type(binding).__name__):
+            if isinstance(binding, Record):
+                generate_record(context, binding, bindings, code)
+            elif isinstance(binding, Enum):
+                generate_enum(context, binding, bindings, code)
+            elif isinstance(binding, Function):
+                generate_function(context, binding, False, bindings, code)
+            else:
+                logger.warning("don't know howto generate %s", binding)
+
+
 def generate_module(context: Context, name, bindings, include_paths, code):
 
     # generate_imports(records, code, include_paths)
@@ -440,6 +538,7 @@ def generate_module(context: Context, name, bindings, include_paths, code):
     # emit(code, "#include <pybind11/pybind11.h>\n")
 
     # generate_includes(context.plugins, code)
+    context.graph.bind(bindings)
     generate_includes([f"{name}_module.hpp"], code)
 
     emit(code, "namespace py = pybind11;\n\n")
@@ -451,19 +550,111 @@ def generate_module(context: Context, name, bindings, include_paths, code):
     for fragment in context.config._prolog:
         emit(code, fragment)
     emit(code, f"PYBIND11_MODULE({name}, m) {{\n\n")
-    for binding in bindings:
-        if isinstance(binding, Record):
-            generate_record(context, binding, bindings, code)
-        elif isinstance(binding, Enum):
-            generate_enum(context, binding, bindings, code)
-        elif isinstance(binding, Function):
-            generate_function(context, binding, False, bindings, code)
-        else:
-            logger.warning("don't know howto generate %s", binding)
+    generate_bindings(context, bindings, bindings, code)
 
     emit(code, """}""")
 
 
+def split_shards(bindings, mode, edges=None, size: int = 32) -> list[tuple[str, list]]:
+    """cut topologically sorted `bindings` into shards
+
+    `mode` is "record" (a shard per record, enums and functions following
+    it), "namespace" (shards of at most `size` bindings of the same
+    namespace) or a number of bindings per shard. The shards are initialized
+    one after the other: "record" and numbered shards are contiguous, a
+    "namespace" shard only takes a binding when it comes after the shards of
+    the binding `edges` (`DepGraph.bindable_edges()`), another one is started
+    otherwise. Each shard keeps the topological order of its bindings.
+    """
+    shards = []
+    labels = {}
+
+    def start(label):
+        label = re.sub(r"\W", "_", label.replace("::", "_")) or "global"
+        count = labels.get(label, 0)
+        labels[label] = count + 1
+        if count:
+            label = f"{label}_{count}"
+        shards.append((label, []))
+
+    if mode == "namespace":
+        placed = {}  # binding -> index of its shard
+        open_shards = {}  # namespace -> index of the shard it fills
+        for binding in bindings:
+            parent = binding.parent
+            while parent and not isinstance(parent, Namespace):
+                parent = parent.parent
+            key = parent.fullname if parent else ""
+            after = max((placed.get(dep, -1) for dep in edges(binding)), default=-1) if edges else -1
+            idx = open_shards.get(key)
+            if idx is None or idx < after or len(shards[idx][1]) >= size:
+                idx = open_shards[key] = len(shards)
+                start(key)
+            shards[idx][1].append(binding)
+            placed[binding] = idx
+        return shards
+
+    for binding in bindings:
+        if mode == "record":
+            if isinstance(binding, Record) or not shards:
+                start(binding.fullname)
+        else:
+            if not shards or len(shards[-1][1]) >= int(mode):
+                start(f"part{len(shards)}")
+        shards[-1][1].append(binding)
+    return shards
+
+
+def generate_shards(context: Context, name, bindings, outdir, open_sink=FileSink) -> list[Sink]:
+    """emit the module as one translation unit per shard plus a main one, the last sink"""
+    context.graph.bind(bindings)
+    sinks = []
+    config = context.config
+    shards = split_shards(bindings, config._shard, context.graph.bindable_edges, config._shard_size)
+    for label, shard in shards:
+        with open_sink(os.path.join(outdir, f"{name}_{label}.cpp")) as code:
+            generate_shard(context, name, label, shard, bindings, code)
+        sinks.append(code)
+
+    with open_sink(os.path.join(outdir, f"{name}_module.cpp")) as code:
+        generate_includes([f"{name}_module.hpp"], code)
+        emit(code, "namespace py = pybind11;\n\n")
+        for label, _ in shards:
+            emit(code, f"void init_{label}(py::module_ &m);\n")
+        emit(code, f"\nPYBIND11_MODULE({name}, m) {{\n")
+        for label, _ in shards:
+            emit(code, f"\tinit_{label}(m);\n")
+        emit(code, "}\n")
+    sinks.append(code)
+    return sinks
+
+
+def generate_shard(context: Context, name, label, shard, bindings, code):
+    """emit `shard` as the `init_{label}` function"""
+    generate_includes([f"{name}_module.hpp"], code)
+    emit(code, "namespace py = pybind11;\n\n")
+    for fragment in context.config._prolog:
+        emit(code, fragment)
+    for binding in shard:
+        if context.needs_trampoline(binding):
+            generate_trampoline(context, code, binding, bindings)
+    emit(code, f"\nvoid init_{label}(py::module_ &m) {{\n\n")
+    # nested enums refer to their record by name, fetch those bound elsewhere
+    scopes = OrderedSet()
+    for binding in shard:
+        if (
+            isinstance(binding, Enum)
+            and isinstance(binding.parent, Record)
+            and binding.parent not in shard
+            and binding.parent in context.graph.bound
+        ):
+            scopes.add(binding.parent.name)
+    for scope in scopes:
+        emit(code, f"""\tpy::object _{scope} = m.attr("{scope}");\n""")
+    generate_bindings(context, shard, bindings, code)
+    emit(code, "}\n")
+
+
 def generate_imports(records, code, include_paths):
     files = OrderedSet()
     for record in records:
@@ -481,39 +672,112 @@ def generate_includes(files, code):
         emit(code, f"""#include <{filename}>\n""")
 
 
-def generate(config: Config, outdir):
-    # modname, bindings, config):
-    ctx = Context(FACTORY, config)
-    modname = config._module_name
-    bindings = config._bindings
-    config.dump()
-    # seeding
-    # generate initial includes
-    header = []
+def parse_groups(includes, jobs: int) -> list[list[str]]:
+    """spread distinct `includes` over at most `jobs` groups, keeping their order"""
+    includes = list(OrderedSet(includes))
+    count = min(jobs, len(includes)) or 1
+    size = -(-len(includes) // count)
+    return [includes[idx:idx + size] for idx in range(0, len(includes), size)] or [[]]
+
+
+def write_header(context: Context, path, content: str):
+    """`write_if_changed()`, accounting for the bytes written"""
+    if write_if_changed(path, content):
+        context.profiler.count("bytes written", len(content.encode()))
+
+
+def binding_includes(config: Config) -> list[str]:
+    """headers declaring the bindings"""
     includes = []
-    for name, paths in bindings.items():
+    for name, paths in config._bindings.items():
         if isinstance(paths, str):
             includes.append(paths)
         elif isinstance(paths, list):
             includes += paths
+    return includes
 
-    generate_includes(includes, header)
+
+def prepare_headers(context: Context, outdir) -> str:
+    """write `{module}_module.hpp` and discover the casters, return the header"""
+    config = context.config
+    modname = config._module_name
+    # seeding
+    # generate initial includes
+    header = []
+    generate_includes(binding_includes(config), header)
 
     generate_includes(
         config.cleaners + ["pybind11/pybind11.h"] + config.plugins, header
     )
 
+    if config._pch:
+        header.insert(0, "#pragma once\n")
     header = "".join(header)
 
-    header_path = os.path.join(outdir, f"{modname}_module.hpp")
+    write_header(context, os.path.join(outdir, f"{modname}_module.hpp"), header)
+
+    # casters are looked for in pybind11 and the plugins only, once
+    casting = []
+    generate_includes(config.cleaners + ["pybind11/pybind11.h"] + config.plugins, casting)
+    casting_path = os.path.join(outdir, f"{modname}_casters.hpp")
+    write_header(context, casting_path, "".join(casting))
+    with context.profiler.phase("casters"):
+        context.discover_casters(casting_path)
+    return header
 
-    with open(header_path, "w") as src:
-        src.write(header)
 
-    tx, inc = ctx.parse(header_path)
-    tx.walk()
+def write_decls(context: Context, outdir) -> str:
+    """write the bound headers without pybind11, see `Context.discover_casters()`"""
+    config = context.config
+    decls = []
+    generate_includes(binding_includes(config), decls)
+    generate_includes(config.cleaners, decls)
+    decls_path = os.path.join(outdir, f"{config._module_name}_decls.hpp")
+    write_header(context, decls_path, "".join(decls))
+    return decls_path
+
+
+def parse_headers(context: Context, outdir) -> tuple[TxUnit, list[Include]]:
+    """parse and walk the bound headers, as configured"""
+    config = context.config
+    modname = config._module_name
+    prof = context.profiler
+    if config._pch:
+        # the pch is for the C++ build, libclang only needs the declarations
+        with prof.phase("pch"):
+            rsp_path = os.path.join(outdir, f"{modname}_module.pch.rsp")
+            flags = context.build_pch(os.path.join(outdir, f"{modname}_module.hpp"))
+            if flags:
+                # the compiler flags using the pch: c++ @{modname}_module.pch.rsp
+                write_header(context, rsp_path, flags)
+            elif os.path.exists(rsp_path):
+                os.unlink(rsp_path)
+    if config._parse_jobs > 1:
+        # units are walked as soon as they are all parsed, a single phase
+        with prof.phase("parse"):
+            paths = []
+            groups = parse_groups(binding_includes(config), config._parse_jobs)
+            for idx, group in enumerate(groups):
+                part = []
+                generate_includes(group, part)
+                generate_includes(config.cleaners, part)
+                path = os.path.join(outdir, f"{modname}_module_{idx}.hpp")
+                write_header(context, path, "".join(part))
+                paths.append(path)
+            tx, inc = context.parse_many(paths, config._parse_jobs)
+    else:
+        decls_path = write_decls(context, outdir)
+        with prof.phase("parse"):
+            tx, inc = context.parse(decls_path)
+        with prof.phase("walk"):
+            tx.walk()
+    return tx, inc
+
+
+def resolve_bindings(context: Context, tx: TxUnit) -> list[NodeProxy]:
+    """nodes named by the config bindings"""
     records = []
-    for name, path in bindings.items():
+    for name, path in context.config._bindings.items():
         if name == '*':
             records += list(tx._filter(Bindable))
             logger.warning("todo wildcard")
@@ -530,107 +794,198 @@ def generate(config: Config, outdir):
 
             except KeyError:
                 logger.warning("%s not found", name)
+    return records
 
-    casters = ctx.casters()
-    for caster in casters:
-        logger.info("caster for: %s", caster)
 
-    def veto(bindable):
-        if bindable in casters:
-            logger.debug("veto caster: %s", bindable)
-            return True
-        if ctx.is_banned(bindable):
-            logger.debug("banned: %s", bindable)
-            return True
-        return False
+def bind_module(context: Context, tx: TxUnit, outdir, open_sink=FileSink) -> Sink:
+    """emit the bindings of the walked `tx`, return the sink of the main source"""
+    config = context.config
+    modname = config._module_name
+    prof = context.profiler
 
-    deps: set[NodeProxy] = OrderedSet(records)
-    star = OrderedSet()
+    with prof.phase("resolve"):
+        records = resolve_bindings(context, tx)
 
-    def seen(ship):
-        return ship in deps or ship in star
+        casters = context.casters()
+        for caster in casters:
+            logger.info("caster for: %s", caster)
 
-    while deps:
-        ship: NodeProxy = deps.pop()
-        if veto(ship):
-            continue
-        logger.info("add %s", ship)
-        star.add(ship)
-        for dep in ship.dependencies:
-            if veto(dep):
-                continue
-            if isinstance(dep, Bindable) and not seen(dep):
-                logger.info("queue %s for %s", dep, ship.fullname)
-                deps.add(dep)
-
-        if isinstance(ship, Record):
-            for members in (ship.fields, ship.methods, ship.constructors, ship.records, ship.enums):
-                for member in members:
-                    if veto(member):
-                        continue
-                    if member.is_public():
-                        if isinstance(member, (Record, Enum)):
-                            logger.info("queue member: %s:%s", ship.fullname, member.displayname)
-                            deps.add(member)
-                        else:
-                            for dep in member.dependencies:
-                                if veto(dep):
-                                    continue
-                                if isinstance(dep, Bindable) and not seen(dep):
-                                    logger.info(
-                                        "queue %s for member %s::%s",
-                                        dep,
-                                        ship.fullname,
-                                        member.displayname,
-                                    )
-                                    deps.add(dep)
-
-    topo = graphlib.TopologicalSorter()
-
-    def filtered_deps(neutron):
-        return [
-            d for d in neutron.dependencies if isinstance(d, Bindable) and not veto(d)
-        ]
-
-    for neutron in star:
-        topo.add(neutron, *filtered_deps(neutron))
-
-    try:
-        records = list(topo.static_order())
-    except graphlib.CycleError as err:
-        logger.error("could not sort: %s", err)
-        breakpoint()
-        print("what' up?")
+        for entry in context.unmatched_config():
+            logger.warning("config entry matches nothing: %s", entry)
+
+    graph = context.graph
+
+    with prof.phase("closure"):
+        star = graph.closure(records)
+
+    with prof.phase("topo"):
+        try:
+            records = graph.topo_order(star)
+        except graphlib.CycleError as err:
+            logger.error("could not sort: %s", err)
+            breakpoint()
+            print("what' up?")
 
     for rec in records:
         logger.info("binding %s", rec)
 
-    code = []
+    # code is streamed to the sinks, writing is part of the generate phase
+    if config._shard:
+        with prof.phase("generate"):
+            sinks = generate_shards(context, modname, records, outdir, open_sink)
+            for sink in sinks:
+                if sink.changed:
+                    prof.count("bytes written", sink.size)
+            # shard names depend on the bindings, let the build system glob this
+            write_header(
+                context,
+                os.path.join(outdir, f"{modname}_module.sources"),
+                "".join(sink.path + "\n" for sink in sinks),
+            )
+        context.outputs = [sink.path for sink in sinks]
+        return sinks[-1]
 
-    generate_module(ctx, modname, records, ctx.config._include_path, code)
-    code = "".join(code)
     source_path = os.path.join(outdir, f"{modname}_module.cpp")
 
-    with open(source_path, 'w') as src:
-        src.write(code)
+    with prof.phase("generate"):
+        with open_sink(source_path) as code:
+            generate_module(context, modname, records, config._include_path, code)
+        if code.changed:
+            prof.count("bytes written", code.size)
+    context.outputs = [source_path]
+    return code
+
+
+def _make_escape(path: str) -> str:
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+def write_depfile(context: Context, outdir) -> str:
+    """write `{module}_module.d`, a make/ninja depfile of the generated sources
+
+    Its targets are the sources `bind_module()` wrote, every shard
+    included. It lists the config file and every header read by the
+    parses, the headers generated in `outdir` left out. Unchanged sources
+    keep their mtime (see `write_if_changed()`), use ninja's `restat = 1`.
+    """
+    modname = context.config._module_name
+    outdir = os.path.realpath(outdir)
+    generated = re.compile(
+        rf"{re.escape(modname)}_(module|decls|casters|module_\d+)\.hpp"
+        rf"|{re.escape(modname)}_module\.sources"
+    )
+    deps = OrderedSet()
+    if context.config._path:
+        deps.add(context.config._path)
+    for path in context.inputs:
+        # not abspath(): libclang reports paths like /../lib/gcc/../../include
+        path = os.path.realpath(path)
+        dirname, basename = os.path.split(path)
+        if dirname != outdir or not generated.fullmatch(basename):
+            deps.add(path)
+    targets = context.outputs or [os.path.join(outdir, f"{modname}_module.cpp")]
+    targets = [os.path.join(outdir, os.path.basename(target)) for target in targets]
+    lines = [" ".join(_make_escape(target) for target in targets) + ":"]
+    lines += [f" {_make_escape(dep)}" for dep in deps]
+    path = os.path.join(outdir, f"{modname}_module.d")
+    write_if_changed(path, " \\\n".join(lines) + "\n")
+    return path
+
+
+def generate(
+    config: Config, outdir, profiler: Profiler | None = None, open_sink=FileSink, index=None
+):
+    """generate bindings for `config` into `outdir`
+
+    The generated sources are streamed into `open_sink(path)` sinks, the
+    sink of `{module}_module.cpp` is returned last. Pass a `MemorySink`
+    factory to keep them in memory instead. `index` is a libclang Index
+    to reuse, a new one by default.
+    """
+    # modname, bindings, config):
+    ctx = Context(FACTORY, config, index)
+    if profiler:
+        ctx.profiler = profiler
+    config.dump()
+    header = prepare_headers(ctx, outdir)
+    tx, inc = parse_headers(ctx, outdir)
+    code = bind_module(ctx, tx, outdir, open_sink)
+    write_depfile(ctx, outdir)
     return tx, inc, header, code
 
 
 def main():
-    import sys
+    import argparse
     from .dom import logger
     logger.setLevel(logging.INFO)
-    outdir = '.'
-    if len(sys.argv) == 3:
-        outdir = sys.argv[2]
-    outdir = os.path.abspath(outdir)
+    parser = argparse.ArgumentParser(prog="python3 -m hydra.gen")
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="config [outdir]",
+        help="module configuration (yaml) and output directory, configs only with --batch",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write <module>_profile.json and a <module>_trace.json Chrome trace to outdir",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="stay alive and regenerate whenever the config or a header changes",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="generate every given config concurrently, into --outdir",
+    )
+    parser.add_argument("-o", "--outdir", help="output directory, the current one by default")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=0, help="concurrent modules with --batch, cpu count by default"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="cache parsed headers there, unless the config sets a cache;"
+        " ~/.cache/hydragen by default with --batch",
+    )
+    args = parser.parse_args()
+    if args.batch:
+        from .session import Session, default_cache_dir
+
+        session = Session(args.jobs, args.cache_dir or default_cache_dir())
+        for path in args.paths:
+            session.add(path, args.outdir or ".")
+        session.run()
+        return
+    if len(args.paths) > 2:
+        parser.error("one config and an output directory expected, use --batch for more")
+    args.config = args.paths[0]
+    if len(args.paths) == 2:
+        if args.outdir and os.path.abspath(args.outdir) != os.path.abspath(args.paths[1]):
+            parser.error("two output directories given: %s and %s" % (args.paths[1], args.outdir))
+        args.outdir = args.paths[1]
+    elif not args.outdir:
+        args.outdir = "."
+    outdir = os.path.abspath(args.outdir)
     print("outdir:", outdir)
-    if len(sys.argv) >= 2:
-        config = Config.parse(sys.argv[1])
-        generate(config, outdir)
-    else:
-        print("usage: python3 -m hydra.gen you_module_config.yaml [outdir]", file=sys.stderr)
-        sys.exit(1)
+    if args.watch:
+        from .watch import Watcher
+
+        Watcher(args.config, outdir).run()
+        return
+    config = Config.parse(args.config)
+    if args.cache_dir and not config._cache_dir:
+        config.set_cache(args.cache_dir)
+    profiler = Profiler() if args.profile else None
+    generate(config, outdir, profiler)
+    if profiler:
+        profiler.close()
+        modname = config._module_name
+        profiler.write(
+            os.path.join(outdir, f"{modname}_profile.json"),
+            os.path.join(outdir, f"{modname}_trace.json"),
+        )
 
 if __name__ == '__main__':
     main()
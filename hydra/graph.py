@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import graphlib
+import typing
+
+from logzero import logger
+from orderedset import OrderedSet
+
+from .dom import Bindable, Enum, NodeProxy, Record
+
+if typing.TYPE_CHECKING:
+    from .dom import Context
+
+
+class DepGraph:
+    """Dependency edges between nodes, each computed once.
+
+    `NodeProxy.dependencies` builds a fresh set on every access, the graph
+    asks once per node and keeps the edges in both directions. It serves
+    the closure of the bindings, their topological order and the "is this
+    dependency bound" checks of the emitters.
+    """
+
+    context: Context
+    bound: set[NodeProxy]
+    _edges: dict[NodeProxy, tuple[NodeProxy, ...]]
+    _reverse: dict[NodeProxy, OrderedSet]
+    _bindable: dict[NodeProxy, tuple[NodeProxy, ...]]
+    _closure: dict[NodeProxy, tuple[NodeProxy, ...]]
+    _vetoed: dict[NodeProxy, bool]
+    _unbound: dict[NodeProxy, NodeProxy | None]
+
+    def __init__(self, context: Context):
+        self.context = context
+        self.bound = set()
+        self._edges = {}
+        self._reverse = {}
+        self._bindable = {}
+        self._closure = {}
+        self._vetoed = {}
+        self._unbound = {}
+
+    def edges(self, node: NodeProxy) -> tuple[NodeProxy, ...]:
+        """`node.dependencies`"""
+        edges = self._edges.get(node)
+        if edges is None:
+            edges = self._edges[node] = tuple(node.dependencies)
+            for dep in edges:
+                self._reverse.setdefault(dep, OrderedSet()).add(node)
+        return edges
+
+    def dependents(self, node: NodeProxy) -> OrderedSet:
+        """nodes depending on `node`, among those whose edges were computed"""
+        return self._reverse.get(node, OrderedSet())
+
+    def veto(self, node: NodeProxy) -> bool:
+        """check if `node` is left out of the bindings: banned or converted by a caster"""
+        vetoed = self._vetoed.get(node)
+        if vetoed is None:
+            vetoed = False
+            if node in self.context.casters():
+                logger.debug("veto caster: %s", node)
+                vetoed = True
+            elif self.context.is_banned(node):
+                logger.debug("banned: %s", node)
+                vetoed = True
+            self._vetoed[node] = vetoed
+        return vetoed
+
+    def bindable_edges(self, node: NodeProxy) -> tuple[NodeProxy, ...]:
+        """dependencies of `node` which need bindings of their own"""
+        edges = self._bindable.get(node)
+        if edges is None:
+            edges = self._bindable[node] = tuple(
+                dep
+                for dep in self.edges(node)
+                if isinstance(dep, Bindable) and not self.veto(dep)
+            )
+        return edges
+
+    def closure_edges(self, node: NodeProxy) -> tuple[NodeProxy, ...]:
+        """what binding `node` pulls in
+
+        For a record this includes its public nested records and enums and
+        the dependencies of its other public members.
+        """
+        edges = self._closure.get(node)
+        if edges is None:
+            edges = OrderedSet(self.bindable_edges(node))
+            if isinstance(node, Record):
+                for members in (node.fields, node.methods, node.constructors, node.records, node.enums):
+                    for member in members:
+                        if self.veto(member) or not member.is_public():
+                            continue
+                        if isinstance(member, (Record, Enum)):
+                            edges.add(member)
+                        else:
+                            edges |= self.bindable_edges(member)
+            edges = self._closure[node] = tuple(edges)
+        return edges
+
+    def closure(self, roots) -> OrderedSet:
+        """`roots` and everything they pull in, each edge is followed once"""
+        star = OrderedSet()
+        stack = list(roots)
+        stack.reverse()
+        while stack:
+            node = stack.pop()
+            if node in star or self.veto(node):
+                continue
+            logger.info("add %s", node)
+            star.add(node)
+            self.context.profiler.count("closure iterations")
+            for dep in reversed(self.closure_edges(node)):
+                if dep not in star:
+                    stack.append(dep)
+        return star
+
+    def topo_order(self, nodes) -> list[NodeProxy]:
+        """`nodes` sorted after their dependencies, see `stable_order()`"""
+        topo = graphlib.TopologicalSorter()
+        for node in nodes:
+            topo.add(node, *self.bindable_edges(node))
+        return stable_order(topo)
+
+    def bind(self, bindings):
+        """record the nodes the module binds"""
+        self.bound = set(bindings)
+        self._unbound.clear()
+
+    def unbound(self, node: NodeProxy) -> NodeProxy | None:
+        """first dependency of `node` python cannot convert: neither bound, builtin nor cast"""
+        try:
+            return self._unbound[node]
+        except KeyError:
+            pass
+        casters = self.context.casters()
+        missing = None
+        for dep in self.edges(node):
+            if dep not in self.bound and dep not in casters and not dep.is_builtin():
+                missing = dep
+                break
+        self._unbound[node] = missing
+        return missing
+
+
+def stable_order(topo: graphlib.TopologicalSorter) -> list:
+    """`topo.static_order()`, with ties broken by name rather than insertion order"""
+    topo.prepare()
+    order = []
+    while topo.is_active():
+        ready = sorted(topo.get_ready(), key=lambda n: (n.fullname, n.displayname, n.usr or ""))
+        order.extend(ready)
+        topo.done(*ready)
+    return order
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from logzero import logger
+
+
+class NullProfiler:
+    """Profiler interface, doing nothing. The default of every `Context`."""
+
+    enabled = False
+
+    _nothing = contextlib.nullcontext()
+
+    def phase(self, name: str):
+        return self._nothing
+
+    def span(self, name: str, category: str = "", **args):
+        return self._nothing
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+
+class Profiler(NullProfiler):
+    """Phase level timings, memory peaks and counters of a generator run.
+
+    Phases (parse, walk, closure, ...) follow each other, each one records
+    wall time, cpu time, the tracemalloc peak and the counters bumped while
+    it ran. Spans are finer grained (one per emitted binding) and only
+    end up in the Chrome trace.
+    """
+
+    enabled = True
+
+    phases: list[dict]
+    counters: dict[str, int]
+    events: list[dict]
+
+    def __init__(self, trace_memory: bool = True):
+        self.phases = []
+        self.counters = {}
+        self.events = []
+        self.trace_memory = trace_memory
+        self._started_tracing = False
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def _now(self) -> float:
+        """microseconds since the profiler was created"""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        counters = dict(self.counters)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        cpu = time.process_time()
+        start = self._now()
+        try:
+            yield
+        finally:
+            end = self._now()
+            record = {
+                "name": name,
+                "wall": (end - start) / 1e6,
+                "cpu": time.process_time() - cpu,
+                "counters": {
+                    key: value - counters.get(key, 0)
+                    for key, value in self.counters.items()
+                    if value != counters.get(key, 0)
+                },
+            }
+            if self.trace_memory:
+                record["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            self.phases.append(record)
+            self._event(name, "phase", start, end, record["counters"])
+            logger.info("profile: %s %.3fs", name, record["wall"])
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "", **args):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._event(name, category, start, self._now(), args)
+
+    def _event(self, name, category, start, end, args):
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": end - start,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    def report(self) -> dict:
+        report = {
+            "phases": self.phases,
+            "totals": {
+                "wall": sum(phase["wall"] for phase in self.phases),
+                "cpu": sum(phase["cpu"] for phase in self.phases),
+                "counters": self.counters,
+            },
+        }
+        if self.trace_memory:
+            report["totals"]["peak_memory"] = max(
+                (phase["peak_memory"] for phase in self.phases), default=0
+            )
+        return report
+
+    def trace(self) -> dict:
+        """Chrome trace-event format, for chrome://tracing or Perfetto"""
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+    def write(self, report_path: str, trace_path: str):
+        with open(report_path, "w") as dst:
+            json.dump(self.report(), dst, indent=2)
+        with open(trace_path, "w") as dst:
+            json.dump(self.trace(), dst)
+        logger.info("profile: %s, %s", report_path, trace_path)
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+NULL_PROFILER = NullProfiler()
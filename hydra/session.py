@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from clang.cindex import Index
+from logzero import logger
+
+from .conf import Config
+from .gen import generate
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "hydragen"
+
+
+class Session:
+    """Generate several modules, sharing what can be shared.
+
+    Modules are generated concurrently in a process pool, each worker
+    keeps one libclang Index for all the modules it is handed. Caching
+    stays opt-in: given a `cache_dir`, e.g. `default_cache_dir()`, modules
+    whose config has no cache directory use it, so they share the caster
+    discovery and the saved translation units (see
+    `Context.casters_manifest()` and `AstCache`), across runs too.
+
+        session = Session(jobs=3, cache_dir=default_cache_dir())
+        session.add("core.yaml", "build/core").add("gui.yaml", "build/gui")
+        session.run()
+    """
+
+    jobs: int
+    cache_dir: Path | None
+    modules: list[tuple[Config, str]]
+
+    def __init__(self, jobs: int = 0, cache_dir: str | Path | None = None):
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        self.jobs = jobs
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.modules = []
+
+    def add(self, config: Config | str | Path, outdir: str | Path) -> Session:
+        if not isinstance(config, Config):
+            config = Config.parse(str(config))
+        if self.cache_dir and not config._cache_dir:
+            config.set_cache(self.cache_dir)
+        self.modules.append((config, os.path.abspath(outdir)))
+        return self
+
+    def run(self) -> dict[str, float]:
+        """generate every module, return their generation time by module name"""
+        timings = {}
+        failed = []
+        if self.jobs == 1 or len(self.modules) == 1:
+            _init_worker()
+            for config, outdir in self.modules:
+                name, elapsed = _generate(config, outdir)
+                timings[name] = elapsed
+            return timings
+        workers = min(self.jobs, len(self.modules))
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(_generate, config, outdir): config._module_name
+                for config, outdir in self.modules
+            }
+            for future in as_completed(futures):
+                try:
+                    name, elapsed = future.result()
+                except Exception:
+                    logger.exception("session: %s failed", futures[future])
+                    failed.append(futures[future])
+                    continue
+                logger.info("session: %s generated in %.2fs", name, elapsed)
+                timings[name] = elapsed
+        if failed:
+            raise RuntimeError("generation failed for %s" % ", ".join(failed))
+        return timings
+
+
+_index: Index | None = None
+
+
+def _init_worker():
+    global _index
+    if _index is None:
+        _index = Index.create()
+
+
+def _generate(config: Config, outdir: str) -> tuple[str, float]:
+    start = time.perf_counter()
+    os.makedirs(outdir, exist_ok=True)
+    generate(config, outdir, index=_index)
+    return config._module_name, time.perf_counter() - start
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import errno
+import filecmp
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+from logzero import logger
+
+_TEMP_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+
+
+def _mkstemp(path) -> tuple[int, str]:
+    """create a temporary file next to `path`, open for writing
+
+    Unlike `tempfile.mkstemp()`, which makes it private, the file gets the
+    mode the umask gives to new files, so replacing `path` with it does not
+    need a chmod (nor reading the umask, which can only be done by changing it).
+    """
+    directory = os.path.dirname(path) or "."
+    for _ in range(tempfile.TMP_MAX):
+        tmp = os.path.join(directory, "tmp%s.tmp" % os.urandom(6).hex())
+        try:
+            return os.open(tmp, _TEMP_FLAGS, 0o666), tmp
+        except FileExistsError:
+            continue
+    raise FileExistsError(errno.EEXIST, "no usable temporary name", directory)
+
+
+def write_if_changed(path, content: str) -> bool:
+    """atomically replace `path` with `content`, unless it already holds it
+
+    Leaving identical files untouched keeps their mtime, so make, ninja and
+    ccache have nothing to do.
+    """
+    data = content.encode()
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as src:
+                if src.read() == data:
+                    logger.debug("unchanged: %s", path)
+                    return False
+    except OSError:
+        pass
+    fd, tmp = _mkstemp(path)
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            dst.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    logger.info("written: %s", path)
+    return True
+
+
+class Sink(ABC):
+    """Destination of emitted code fragments.
+
+    Emitters only `append()` to a sink, like they used to a list, so a
+    plain list still works wherever a sink is expected.
+    Sinks are context managers: the output is committed on a clean exit
+    and dropped when an exception escapes.
+    """
+
+    path: str
+    size: int  # bytes committed, 0 until closed
+    changed: bool  # set once closed
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self.changed = False
+
+    @abstractmethod
+    def append(self, fragment: str):
+        ...
+
+    @abstractmethod
+    def close(self) -> bool:
+        """commit the output, return True when it changed"""
+
+    def discard(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class FileSink(Sink):
+    """Stream fragments to `path` through a buffered temporary file.
+
+    Memory use does not depend on the amount of code emitted. On close the
+    temporary file replaces `path` atomically, unless both are identical:
+    `path` is then left untouched, like `write_if_changed()` does.
+    """
+
+    def __init__(self, path: str, buffering: int = 1 << 16):
+        super().__init__(path)
+        fd, self._tmp = _mkstemp(path)
+        self._file = open(fd, "w", encoding="utf-8", newline="", buffering=buffering)
+
+    def append(self, fragment: str):
+        self._file.write(fragment)
+
+    write = append
+
+    def close(self) -> bool:
+        if self._file.closed:
+            return self.changed
+        self._file.close()
+        try:
+            self.size = os.path.getsize(self._tmp)
+            try:
+                same = os.path.getsize(self.path) == self.size and filecmp.cmp(
+                    self._tmp, self.path, shallow=False
+                )
+            except OSError:
+                same = False
+            if same:
+                logger.debug("unchanged: %s", self.path)
+                os.unlink(self._tmp)
+                return False
+            os.replace(self._tmp, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        logger.info("written: %s", self.path)
+        self.changed = True
+        return True
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.unlink(self._tmp)
+        except FileNotFoundError:
+            pass
+
+
+class MemorySink(Sink):
+    """Keep fragments in memory, for tests and interactive use.
+
+    Nothing is written to disk, `getvalue()` (or `str()`) returns the code.
+    """
+
+    def __init__(self, path: str = ""):
+        super().__init__(path)
+        self._fragments = []
+
+    def append(self, fragment: str):
+        self._fragments.append(fragment)
+
+    write = append
+
+    def getvalue(self) -> str:
+        return "".join(self._fragments)
+
+    __str__ = getvalue
+
+    def close(self) -> bool:
+        self.size = len(self.getvalue().encode())
+        self.changed = True
+        return True
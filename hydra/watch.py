@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+
+from logzero import logger
+
+from .conf import Config
+from .dom import FACTORY, Context, TxUnit
+from .gen import bind_module, prepare_headers, write_decls, write_depfile
+from .sink import FileSink
+
+
+class Watcher:
+    """Keep a generator alive and regenerate the bindings on change.
+
+    The libclang Index, translation unit and caster discovery survive
+    between runs. A header edit reparses the translation unit, reusing its
+    precompiled preamble, walks it again (lazily) and emits the module; outputs
+    whose contents did not change are left untouched (see `FileSink`).
+    A config or plugin edit starts over.
+    """
+
+    config_path: str
+    outdir: str
+    interval: float
+    context: Context | None
+    tx: TxUnit | None
+    _stamps: dict[str, tuple[int, int] | None]
+    _plugins: set[str]
+
+    def __init__(self, config_path: str, outdir: str, interval: float = 0.3, open_sink=FileSink):
+        self.config_path = os.path.abspath(config_path)
+        self.outdir = outdir
+        self.interval = interval
+        self.open_sink = open_sink
+        self.context = None
+        self.tx = None
+        self._stamps = {}
+        self._plugins = set()
+
+    def load(self):
+        """parse the config and the headers from scratch, then generate"""
+        start = time.perf_counter()
+        config = Config.parse(self.config_path)
+        if config._pch or config._parse_jobs > 1:
+            logger.warning("watch: pch and parse_jobs are ignored, a single unit is reparsed")
+        ctx = self.context = Context(FACTORY, config)
+        ctx.preamble = True
+        # the walk dominates an update, only materialize what the bindings need
+        ctx.lazy = True
+        prepare_headers(ctx, self.outdir)
+        ctx.parse(write_decls(ctx, self.outdir))
+        # libclang precompiles the preamble on the first reparse, pay for it now
+        self.tx, _ = ctx.reparse()
+        self.tx.walk()
+        bind_module(ctx, self.tx, self.outdir, self.open_sink)
+        write_depfile(ctx, self.outdir)
+        casting_path = os.path.join(self.outdir, f"{config._module_name}_casters.hpp")
+        self._plugins = self._casting_files(ctx.casters_manifest(casting_path))
+        self._stamps = self._snapshot()
+        logger.info("watch: loaded in %.2fs, %d files watched", time.perf_counter() - start, len(self._stamps))
+
+    def update(self):
+        """reparse the headers and generate"""
+        start = time.perf_counter()
+        ctx = self.context
+        self.tx, _ = ctx.reparse()
+        self.tx.walk()
+        bind_module(ctx, self.tx, self.outdir, self.open_sink)
+        write_depfile(ctx, self.outdir)
+        self._stamps = self._snapshot()
+        logger.info("watch: updated in %.2fs", time.perf_counter() - start)
+
+    def _casting_files(self, manifest: str) -> set[str]:
+        """files the caster discovery depends on"""
+        try:
+            with open(manifest) as src:
+                return set(json.load(src)["includes"])
+        except (OSError, ValueError, KeyError):
+            return set()
+
+    def files(self) -> set[str]:
+        files = {self.config_path} | self._plugins
+        if self.context and self.context._tu:
+            files.add(self.context._tu.spelling)
+            files.update(inc.include.name for inc in self.context._tu.get_includes())
+        return files
+
+    def _snapshot(self) -> dict[str, tuple[int, int] | None]:
+        stamps = {}
+        for path in self.files():
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def changes(self) -> list[str]:
+        """watched files touched since the last run"""
+        changed = []
+        for path, stamp in self._stamps.items():
+            try:
+                st = os.stat(path)
+                current = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                current = None
+            if current != stamp:
+                changed.append(path)
+        return changed
+
+    def step(self) -> bool:
+        """regenerate if something changed, return True when it did"""
+        changed = self.changes()
+        if not changed:
+            return False
+        logger.info("watch: changed %s", ", ".join(changed))
+        try:
+            if self.config_path in changed or self._plugins.intersection(changed):
+                self.load()
+            else:
+                self.update()
+        except Exception:
+            # keep watching, the next edit may fix it
+            logger.exception("watch: generation failed")
+            self._stamps = self._snapshot()
+        return True
+
+    def run(self):
+        self.load()
+        logger.info("watch: waiting for changes, ^C to stop")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.step()
+        except KeyboardInterrupt:
+            pass
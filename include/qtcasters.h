@@ -1,4 +1,7 @@
 #include <QtCore/QString>
+#if QT_VERSION >= QT_VERSION_CHECK(5, 10, 0)
+#include <QtCore/QStringView>
+#endif
 #undef slots
 #include <pybind11/pybind11.h>
 #include <pybind11/pytypes.h>
@@ -10,44 +13,128 @@
 
 
 namespace pybind11 { namespace detail {
-    template <> struct type_caster<QString>  : public type_caster_base<QString> {
-        using base = type_caster_base<QString>;
+    /**
+     * Build a python str straight from UTF-16 code units.
+     *
+     * One pass finds the widest code unit: ASCII and Latin-1 strings are
+     * narrowed into a 1 byte str, the rest of the BMP is copied as is into
+     * a 2 byte str. Surrogate pairs need decoding, lone surrogates are
+     * replaced by U+FFFD (as `QString::toUtf8()` does).
+     */
+    inline handle qstring_to_python(const QChar *data, Py_ssize_t size) {
+        const ushort *units = reinterpret_cast<const ushort *>(data);
+        ushort widest = 0;
+        Py_ssize_t idx = 0;
+        for (; idx < size; ++idx) {
+            widest |= units[idx];
+            if (widest >= 0x100)
+                break;
+        }
+        if (idx == size) {
+            PyObject *str = PyUnicode_New(size, widest < 0x80 ? 0x7f : 0xff);
+            if (!str)
+                return nullptr;
+            Py_UCS1 *dst = PyUnicode_1BYTE_DATA(str);
+            for (idx = 0; idx < size; ++idx)
+                dst[idx] = static_cast<Py_UCS1>(units[idx]);
+            return str;
+        }
+        for (; idx < size; ++idx) {
+            if ((units[idx] & 0xf800) == 0xd800) {
+                int byteorder = Q_BYTE_ORDER == Q_LITTLE_ENDIAN ? -1 : 1;
+                return PyUnicode_DecodeUTF16(
+                    reinterpret_cast<const char *>(units), size * 2, "replace", &byteorder);
+            }
+        }
+        return PyUnicode_FromKindAndData(PyUnicode_2BYTE_KIND, units, size);
+    }
+
+    /**
+     * Read a python str, from its PEP 393 buffer.
+     *
+     * Returns the 2 byte buffer of the str, which is UTF-16 already, and
+     * leaves `storage` alone; otherwise widens the str into `storage`, in a
+     * single allocation, and returns its data. nullptr when `src` is not a str.
+     */
+    inline const QChar *qstring_from_python(PyObject *src, Py_ssize_t &size, QString &storage) {
+        if (!PyUnicode_Check(src))
+            return nullptr;
+#if PY_VERSION_HEX < 0x030C0000
+        if (PyUnicode_READY(src) != 0) {
+            PyErr_Clear();
+            return nullptr;
+        }
+#endif
+        size = PyUnicode_GET_LENGTH(src);
+        const void *data = PyUnicode_DATA(src);
+        switch (PyUnicode_KIND(src)) {
+        case PyUnicode_1BYTE_KIND:
+            storage = QString::fromLatin1(static_cast<const char *>(data), size);
+            break;
+        case PyUnicode_2BYTE_KIND:
+            return reinterpret_cast<const QChar *>(data);
+        default:
+#if QT_VERSION >= QT_VERSION_CHECK(6, 0, 0)
+            storage = QString::fromUcs4(static_cast<const char32_t *>(data), size);
+#else
+            storage = QString::fromUcs4(static_cast<const uint *>(data), size);
+#endif
+            // code points past the BMP take two code units
+            size = storage.size();
+        }
+        return storage.constData();
+    }
+
+    template <> struct type_caster<QString> {
     public:
-        /**
-         * This macro establishes the name 'inty' in
-         * function signatures and declares a local variable
-         * 'value' of type inty
-         */
         PYBIND11_TYPE_CASTER(QString, _("QString"));
 
         /**
-         * Conversion part 1 (Python->C++): convert a PyObject into a inty
-         * instance or return false upon failure. The second argument
-         * indicates whether implicit conversions should be applied.
+         * Python->C++: fill `value` from the str buffer, a `const QString &`
+         * argument then refers to it directly.
          */
         bool load(handle src, bool) {
-            /* Extract PyObject from handle */
-            PyObject *source = src.ptr();
-            if ( !PyUnicode_Check(source) ) 
+            Py_ssize_t size;
+            const QChar *data = qstring_from_python(src.ptr(), size, value);
+            if (!data)
                 return false;
-            ssize_t sz;
-            const char *s = PyUnicode_AsUTF8AndSize(source, &sz);
-            value = QString::fromUtf8(s, sz);
-            /* Try converting into a Python integer value */
-            /* Ensure return code was OK (to avoid out-of-range errors etc) */
-            return true; //!(value.long_value == -1 && !PyErr_Occurred());
+            if (data != value.constData())
+                value = QString(data, size);
+            return true;
         }
 
         /**
-         * Conversion part 2 (C++ -> Python): convert an inty instance into
-         * a Python object. The second and third arguments are used to
-         * indicate the return value policy and parent object (for
-         * ``return_value_policy::reference_internal``) and are generally
-         * ignored by implicit casters.
+         * C++->Python: no intermediate UTF-8 copy, see `qstring_to_python()`.
          */
-        static handle cast(QString src, return_value_policy /* policy */, handle /* parent */) {
-            QByteArray utf8 = src.toUtf8();
-            return PyUnicode_FromStringAndSize(utf8.data(), utf8.size());
+        static handle cast(const QString &src, return_value_policy /* policy */, handle /* parent */) {
+            return qstring_to_python(src.constData(), src.size());
         }
     };
-}} // namespace pybind11::detail
\ No newline at end of file
+
+#if QT_VERSION >= QT_VERSION_CHECK(5, 10, 0)
+    /**
+     * A view of a 2 byte str points into the str itself, which outlives
+     * the call; other strs are converted into a QString the caster owns.
+     */
+    template <> struct type_caster<QStringView> {
+    public:
+        PYBIND11_TYPE_CASTER(QStringView, _("str"));
+
+        bool load(handle src, bool) {
+            Py_ssize_t size;
+            const QChar *data = qstring_from_python(src.ptr(), size, storage);
+            if (!data)
+                return false;
+            value = QStringView(data, size);
+            return true;
+        }
+
+        static handle cast(QStringView src, return_value_policy /* policy */, handle /* parent */) {
+            return qstring_to_python(src.data(), src.size());
+        }
+
+    private:
+        QString storage;
+    };
+#endif
+}} // namespace pybind11::detail